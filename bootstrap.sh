@@ -3,3 +3,4 @@
 cd "$(dirname $0)"
 git submodule init && git submodule update
 ./data/extras/enhance.py data/TextAsset/enUS.txt fireplace/cards/enUS.xml
+python3 -m fireplace.cardxml fireplace/cards/enUS.xml fireplace/cards/enUS.db
@@ -1,27 +1,126 @@
-import logging
 import random
-from itertools import chain
+from bisect import bisect
+from itertools import accumulate
+from types import GeneratorType
 from .enums import CardType, PowSubType, Zone
-from .entity import Entity, new_order_of_play
+from .entity import Entity
+from .logging import get_logger
+from .utils import IdentityDict
+
+
+log = get_logger(__name__)
+
+
+class CardPool(object):
+	"""
+	An immutable pool of card IDs to draw random cards from.
+	If \a weights are given, each card is drawn proportionally to its weight.
+	"""
+	def __init__(self, cards, weights=None):
+		self.cards = tuple(cards)
+		self.weights = None
+		self._cum_weights = None
+		if weights is not None:
+			self.weights = tuple(weights)
+			self._cum_weights = list(accumulate(self.weights))
+			assert len(self.weights) == len(self.cards)
+
+	def __repr__(self):
+		return "<%s (%i cards)>" % (self.__class__.__name__, len(self.cards))
+
+	def __len__(self):
+		return len(self.cards)
+
+	def pick(self, rng=random) -> str:
+		"""
+		Draw a card from the pool, using the random number generator \a rng
+		(usually the game's, see Game.random).
+		"""
+		if self._cum_weights is None:
+			return rng.choice(self.cards)
+		i = bisect(self._cum_weights, rng.random() * self._cum_weights[-1])
+		return self.cards[i]
+
+	def sample(self, count, replace=False, rng=random) -> [str]:
+		"""
+		Draw \a count cards from the pool, with or without replacement.
+		Without replacement, at most len(pool) cards are returned.
+		"""
+		if replace:
+			return [self.pick(rng) for i in range(count)]
+		if self.weights is None:
+			return rng.sample(self.cards, min(count, len(self.cards)))
+
+		weights = list(self.weights)
+		ret = []
+		for i in range(min(count, len(self.cards))):
+			cum_weights = list(accumulate(weights))
+			if not cum_weights[-1]:
+				break
+			index = bisect(cum_weights, rng.random() * cum_weights[-1])
+			ret.append(self.cards[index])
+			weights[index] = 0
+		return ret
+
+
+# Process-wide registry of the card pools matching a set of filters
+_card_pools = {}
+
+
+def _weight_name(weight):
+	if weight is None:
+		return None
+	name = getattr(weight, "__qualname__", "<unnamed>")
+	if "<" in name:
+		# Lambdas and closures would add a new pool on every call
+		raise ValueError("Card pool weights must be module-level functions: %r" % (weight))
+	return "%s.%s" % (weight.__module__, name)
+
+
+def get_card_pool(weight=None, **filters):
+	"""
+	Returns the CardPool of the cards matching \a filters (see cards.filter()).
+	If \a weight is given, it is called with the data of every matching card
+	and returns that card's weight. It must be a module-level function: pools
+	are keyed by its name, shared by the whole process and only built the
+	first time.
+	"""
+	key = (_weight_name(weight), tuple(sorted((k, v) for k, v in filters.items() if v is not None)))
+	pool = _card_pools.get(key)
+	if pool is None:
+		from . import cards
+		ids = cards.filter(**filters)
+		weights = None
+		if weight is not None:
+			weights = [weight(getattr(cards, id)) for id in ids]
+		pool = _card_pools[key] = CardPool(ids, weights)
+	return pool
 
 
 class RandomCardGenerator(object):
 	"""
 	Store filters and generate a random card matching the filters on pick()
 	"""
-	def __init__(self, **filters):
+	def __init__(self, weight=None, **filters):
 		self.filters = filters
-		self._cards = None
+		self.weight = weight
+		self._pool = None
+
+	@property
+	def pool(self):
+		if self._pool is None:
+			self._pool = get_card_pool(self.weight, **self.filters)
+		return self._pool
 
 	@property
 	def cards(self):
-		if self._cards is None:
-			from . import cards
-			self._cards = cards.filter(**self.filters)
-		return self._cards
+		return self.pool.cards
+
+	def pick(self, rng=random) -> str:
+		return self.pool.pick(rng)
 
-	def pick(self) -> str:
-		return random.choice(self.cards)
+	def sample(self, count, replace=False, rng=random) -> [str]:
+		return self.pool.sample(count, replace, rng)
 
 
 class Evaluator:
@@ -54,8 +153,11 @@ class Evaluator:
 		return []
 
 	def trigger(self, source, game):
+		return game.run(self.resolve(source, game))
+
+	def resolve(self, source, game):
 		for action in self.get_actions(source, game):
-			action.trigger(source, game)
+			yield action.resolve(source, game)
 
 
 class Dead(Evaluator):
@@ -111,7 +213,7 @@ def _eval_card(source, game, card):
 	"""
 
 	if isinstance(card, RandomCardGenerator):
-		card = card.pick()
+		card = card.pick(game.random)
 	elif isinstance(card, Copy):
 		c = card.pick(source, game)
 		card = [entity.id if not isinstance(entity, str) else entity for entity in c]
@@ -146,12 +248,54 @@ class EventListener:
 		return "<EventListener %r>" % (self.trigger)
 
 
+class EventListenerIndex:
+	"""
+	Index of the entities with active event listeners, keyed by the
+	(action class, ON/AFTER) pairs their listeners trigger on.
+	A listener is active while its entity is in the listener's zone.
+	Changes to the index are changes to the game of \a owner.
+	"""
+	def __init__(self, owner):
+		self._owner = owner
+		self._index = {}
+
+	def _keys(self, event):
+		for cls in type(event.trigger).__mro__:
+			if issubclass(cls, Action):
+				yield cls, event.at
+
+	def add(self, entity, event):
+		for key in self._keys(event):
+			entities = self._index.get(key)
+			if entities is None:
+				entities = self._index[key] = IdentityDict()
+				entities._owner = self._owner
+			entities[entity] = entities.get(entity, 0) + 1
+
+	def remove(self, entity, event):
+		for key in self._keys(event):
+			entities = self._index[key]
+			count = entities[entity] - 1
+			if count:
+				entities[entity] = count
+			else:
+				del entities[entity]
+
+	def get(self, cls, at):
+		"""
+		Returns the entities with an active listener for \a cls actions at \a at
+		"""
+		entities = self._index.get((cls, at))
+		if not entities:
+			return []
+		return list(entities)
+
+
 class Action:  # Lawsuit
 	args = ()
 	type = PowSubType.TRIGGER
 
 	def __init__(self, *args, **kwargs):
-		self.order_of_play = new_order_of_play()
 		self.times = 1
 		self._args = args
 		for k, v in zip(self.args, args):
@@ -174,8 +318,20 @@ class Action:  # Lawsuit
 	def once(self, *actions, zone=Zone.PLAY):
 		return EventListener(self, actions, EventListener.ON, zone=zone, once=True)
 
+	def trigger(self, source, game):
+		"""
+		Resolve the action from \a source and return its result.
+		Actions which trigger other actions implement do() as a generator
+		frame (see Game.run), its return value being the result of do().
+		"""
+		return game.run(self.resolve(source, game))
+
 	def broadcast(self, game, at, *args):
-		for entity in chain(game.hands, game.entities):
+		"""
+		Frame (see Game.run) resolving the listeners triggered by the action,
+		one after the other. Used as `yield self.broadcast(...)` in do().
+		"""
+		for entity in game.listening_entities(self.__class__, at):
 			if entity.ignore_events:
 				continue
 			for event in entity._events:
@@ -188,27 +344,36 @@ class Action:  # Lawsuit
 							actions += action(entity, *args)
 						else:
 							actions.append(action)
-					game.queue_actions(entity, actions)
+					yield game.resolve_actions(entity, actions)
 					if event.once:
 						entity._events.remove(event)
+						if event.zone == entity.zone:
+							game.event_listeners.remove(entity, event)
 
 	def gather(self, game, at, *args):
+		"""
+		Returns the (entity, actions) pairs for the listeners triggered by the
+		action, without resolving them.
+		"""
 		result = []
-		for entity in chain(game.hands, game.entities):
+		for entity in game.listening_entities(self.__class__, at):
 			if entity.ignore_events:
 				continue
 			for event in entity._events:
 				if event.zone != entity.zone:
 					continue
 				if isinstance(event.trigger, self.__class__) and event.at == at and event.trigger.matches(entity, args):
+					actions = []
 					for action in event.actions:
 						if callable(action):
-							result += (entity, action(entity, *args))
+							actions += action(entity, *args)
 						else:
-							result.append((entity, action))
+							actions.append(action)
+					result.append((entity, actions))
 					if event.once:
 						entity._events.remove(event)
-		result.sort(key = x[1].order_of_play) #TODO: Figure out the best place to put sorts like these
+						if event.zone == entity.zone:
+							game.event_listeners.remove(entity, event)
 		return result
 
 	def matches(self, source, args):
@@ -229,12 +394,14 @@ class GameAction(Action):
 	def get_args(self, source, game):
 		return self._args
 
-	def trigger(self, source, game):
+	def resolve(self, source, game):
 		args = self.get_args(source, game)
-		game.manager.action(self.type, source, *args)
-		self.do(source, game, *args)
-		game.manager.action_end(self.type, source, *args)
-		game.process_deaths()
+		game.manager.action(self, source, *args)
+		ret = self.do(source, game, *args)
+		if isinstance(ret, GeneratorType):
+			yield ret
+		game.manager.action_end(self, source, *args)
+		yield game.resolve_deaths()
 
 
 class Attack(GameAction):
@@ -253,9 +420,9 @@ class Attack(GameAction):
 	def do(self, source, game, *args):
 		game.proposed_attacker = self.source
 		game.proposed_defender = self.target
-		logging.info("%r attacks %r", self.source, self.target)
-		self.broadcast(game, EventListener.ON, *args)
-		game._attack()
+		log.info("%r attacks %r", self.source, self.target)
+		yield self.broadcast(game, EventListener.ON, *args)
+		yield game._attack()
 
 
 class BeginTurn(GameAction):
@@ -266,7 +433,7 @@ class BeginTurn(GameAction):
 	type = None
 
 	def do(self, source, game, *args):
-		self.broadcast(game, EventListener.ON, self.player)
+		yield self.broadcast(game, EventListener.ON, self.player)
 		game._begin_turn(self.player)
 
 
@@ -276,7 +443,7 @@ class Deaths(GameAction):
 	"""
 
 	def do(self, source, game, *args):
-		game.process_deaths()
+		yield game.resolve_deaths()
 
 
 class Death(GameAction):
@@ -285,14 +452,14 @@ class Death(GameAction):
 	"""
 
 	def do(self, source, game, target):
-		self.broadcast(game, EventListener.ON, target)
 		consequences_of_death = self.gather(game, EventListener.ON, target)
 		if target.deathrattles:
-			consequences_of_death.extend(Deathrattle(target).gather(target))
-			#game.queue_actions(source, [Deathrattle(target)])
-		consequences_of_death.sort(key = x[1].order_of_play)
-		for entity, action in consequences_of_death:
-			game.queue_actions(entity, action)
+			consequences_of_death += Deathrattle(target).gather(target)
+		# Death triggers and deathrattles resolve in the order their
+		# entities were played
+		consequences_of_death.sort(key=lambda x: x[0].order_of_play)
+		for entity, actions in consequences_of_death:
+			yield game.resolve_actions(entity, actions)
 
 
 class EndTurn(GameAction):
@@ -303,7 +470,7 @@ class EndTurn(GameAction):
 	type = None
 
 	def do(self, source, game, *args):
-		self.broadcast(game, EventListener.ON, self.player)
+		yield self.broadcast(game, EventListener.ON, self.player)
 		game._end_turn()
 
 
@@ -329,17 +496,17 @@ class Play(GameAction):
 			assert self.choose in card.data.choose_cards
 			chosen = game.card(self.choose)
 			chosen.controller = source
-			logging.info("Choose One from %r: %r", card, chosen)
+			log.info("Choose One from %r: %r", card, chosen)
 			if chosen.has_target():
 				chosen.target = self.target
 			card.chosen = chosen
 		card.choose = self.choose
 
-		self.broadcast(game, EventListener.ON, *args)
-		game.process_deaths()
+		yield self.broadcast(game, EventListener.ON, *args)
+		yield game.resolve_deaths()
 		game.play(card)
-		game.process_deaths()
-		self.broadcast(game, EventListener.AFTER, *args)
+		yield game.resolve_deaths()
+		yield self.broadcast(game, EventListener.AFTER, *args)
 
 		card.target = None
 		card.choose = None
@@ -377,17 +544,20 @@ class TargetedAction(Action):
 				ret.append(v)
 		return ret
 
-	def trigger(self, source, game):
+	def resolve(self, source, game):
 		ret = []
 		for i in range(self.times):
 			args = self.evaluate_selectors(source, game)
 			targets = args[0]
-			game.manager.action(self.type, source, targets, *self._args)
-			logging.info("%r triggering %r targeting %r", source, self, targets)
+			game.manager.action(self, source, targets, *self._args)
+			log.info("%r triggering %r targeting %r", source, self, targets)
 			for target in targets:
 				extra_args = self.get_args(source, game, target)
-				ret.append(self.do(source, game, *extra_args))
-			game.manager.action_end(self.type, source, targets, *self._args)
+				result = self.do(source, game, *extra_args)
+				if isinstance(result, GeneratorType):
+					result = yield result
+				ret.append(result)
+			game.manager.action_end(self, source, targets, *self._args)
 		return ret
 
 
@@ -418,7 +588,7 @@ class Damage(TargetedAction):
 	def do(self, source, game, target, *args):
 		amount = target._hit(source, self.amount)
 		if amount:
-			self.broadcast(game, EventListener.ON, target, amount, source)
+			yield self.broadcast(game, EventListener.ON, target, amount, source)
 
 
 class Deathrattle(TargetedAction):
@@ -426,33 +596,24 @@ class Deathrattle(TargetedAction):
 	Trigger deathrattles on card targets.
 	"""
 	def do(self, source, game, target):
+		for entity, actions in self.gather(target):
+			yield game.resolve_actions(entity, actions)
+
+	def gather(self, target):
+		"""
+		Returns the (target, actions) pairs for the deathrattles of \a target
+		"""
+		result = []
 		for deathrattle in target.deathrattles:
 			if callable(deathrattle):
 				actions = deathrattle(target)
 			else:
 				actions = deathrattle
-			game.queue_actions(target, actions)
+			result.append((target, actions))
 
 			if target.controller.extra_deathrattles:
-				logging.info("Triggering deathrattles for %r again", target)
-				game.queue_actions(target, actions)
-	
-	def gather(self, target):
-		#TODO: This certainly isn't the best way to structure it, but I'll figure that out later.
-		result = []
-		for deathrattle in target.deathrattles:
-			if callable(deathrattle):
-				result.extend((target, deathrattle(target)))
-			else:
-				result.extend((target, deathrattle))
-				
-			if target.controller.extra_deathrattles: #TODO: writing it again is dumb
-				logging.info("Triggering deathrattles for %r again", target)
-				if callable(deathrattle):
-					result.extend((target, deathrattle(target)))
-				else:
-					result.extend((target, deathrattle))
-		result.sort(key = x[1].order_of_play) #TODO: Figure out the best place to put sorts like these
+				log.info("Triggering deathrattles for %r again", target)
+				result.append((target, actions))
 		return result
 
 class Destroy(TargetedAction):
@@ -525,7 +686,7 @@ class GainArmor(TargetedAction):
 
 	def do(self, source, game, target):
 		target.armor += self.amount
-		self.broadcast(game, EventListener.ON, target, self.amount)
+		yield self.broadcast(game, EventListener.ON, target, self.amount)
 
 
 class GainMana(TargetedAction):
@@ -549,7 +710,7 @@ class Give(TargetedAction):
 		return (target, cards)
 
 	def do(self, source, game, target, cards):
-		logging.debug("Giving %r to %s", cards, target)
+		log.debug("Giving %r to %s", cards, target)
 		for card in cards:
 			card.controller = target
 			card.zone = Zone.HAND
@@ -572,7 +733,7 @@ class Hit(TargetedAction):
 		if target.type == CardType.WEAPON:
 			target.durability -= self.amount
 		else:
-			attack_source.hit(target, self.amount)
+			return (yield attack_source.resolve_hit(target, self.amount))
 
 
 class Heal(TargetedAction):
@@ -584,15 +745,15 @@ class Heal(TargetedAction):
 	def do(self, source, game, target):
 		if source.controller.outgoing_healing_adjustment:
 			# "healing as damage" (hack-ish)
-			return source.hit(target, self.amount)
+			return (yield source.resolve_hit(target, self.amount))
 
 		amount = self.amount * (source.controller.healing_double + 1)
 		amount = min(amount, target.damage)
 		if amount:
 			# Undamaged targets do not receive heals
-			logging.info("%r heals %r for %i", source, target, amount)
+			log.info("%r heals %r for %i", source, target, amount)
 			target.damage -= amount
-			self.broadcast(game, EventListener.ON, target, amount)
+			yield self.broadcast(game, EventListener.ON, target, amount)
 
 
 class ManaThisTurn(TargetedAction):
@@ -648,8 +809,8 @@ class Reveal(TargetedAction):
 	Reveal secret targets.
 	"""
 	def do(self, source, game, target):
-		logging.info("Revealing secret %r", target)
-		self.broadcast(game, EventListener.ON, target)
+		log.info("Revealing secret %r", target)
+		yield self.broadcast(game, EventListener.ON, target)
 		target.destroy()
 
 
@@ -663,6 +824,10 @@ class SetTag(TargetedAction):
 		for k, v in self.values.items():
 			if target.tags[k] != v:
 				target.tags[k] = v
+		# Tags such as the race can change which entities an aura applies to
+		game.invalidate_auras()
+		# ... and health or durability can make the target lethal
+		game.mark_death_candidate(target)
 
 
 class Silence(TargetedAction):
@@ -685,16 +850,16 @@ class Summon(TargetedAction):
 		return (target, cards)
 
 	def do(self, source, game, target, cards):
-		logging.info("%s summons %r", target, cards)
+		log.info("%s summons %r", target, cards)
 		if not isinstance(cards, list):
 			cards = [cards]
 
 		for card in cards:
 			if card.controller != target:
 				card.controller = target
-			self.broadcast(game, EventListener.ON, target, card)
+			yield self.broadcast(game, EventListener.ON, target, card)
 			card.summon()
-			self.broadcast(game, EventListener.AFTER, target, card)
+			yield self.broadcast(game, EventListener.AFTER, target, card)
 
 
 class Shuffle(TargetedAction):
@@ -708,7 +873,7 @@ class Shuffle(TargetedAction):
 		return (target, cards)
 
 	def do(self, source, game, target, cards):
-		logging.info("%r shuffles into %s's deck", cards, target)
+		log.info("%r shuffles into %s's deck", cards, target)
 		if not isinstance(cards, list):
 			cards = [cards]
 
@@ -1,8 +1,8 @@
-import random
-from ..actions import RandomCardGenerator, Give, Summon
+from ..actions import CardPool, RandomCardGenerator, Give, Summon
 from ..enums import CardType
 from ..game import Game
 from ..cards.utils import RandomMinion
+from ..utils import RandomStream
 
 
 class BlackrockShowdownBrawl(Game):
@@ -57,11 +57,12 @@ class BlackrockShowdownBrawl(Game):
 	], "TBA01_1")
 
 	@classmethod
-	def new_game(cls, *players):
-		decks = random.sample((cls.NEFARIAN_DECK, cls.RAGNAROS_DECK), 2)
+	def new_game(cls, *players, seed=None):
+		rng = RandomStream(seed)
+		decks = rng.sample((cls.NEFARIAN_DECK, cls.RAGNAROS_DECK), 2)
 		for player, deck in zip(players, decks):
 			player.prepare_deck(deck[0], hero=deck[1])
-		return cls(players)
+		return cls(players, seed=rng.fork("game").seed_value)
 
 	def prepare(self):
 		super().prepare()
@@ -83,7 +84,7 @@ class BananaBrawl(Game):
 	"""
 
 	class RandomBanana(RandomCardGenerator):
-		cards = ("EX1_014t", "TB_006", "TB_007", "TB_008")
+		pool = CardPool(("EX1_014t", "TB_006", "TB_007", "TB_008"))
 
 	def _schedule_death(self, card):
 		ret = super()._schedule_death(card)
@@ -101,16 +102,16 @@ class SpidersEverywhereBrawl(Game):
 	Webspinners.
 	"""
 
-	def __init__(self, players):
+	def __init__(self, players, seed=None):
 		from .. import cards
-		super().__init__(players)
+		super().__init__(players, seed)
 		for player in players:
 			hero = player.original_deck.hero
 			player_class = getattr(cards, hero).card_class
 			spells = cards.filter(card_class=player_class, type=CardType.SPELL)
 			deck = ["FP1_011"] * 23
 			for i in range(7):
-				deck.append(random.choice(spells))
+				deck.append(self.random.choice(spells))
 			player.prepare_deck(deck, hero)
 
 
@@ -1,11 +1,14 @@
-import logging
 from itertools import chain
 from . import cards as CardDB, targeting
 from .actions import Damage, Deaths, Destroy, Heal, Play
-from .entity import Entity, boolean_property, int_property, new_order_of_play
+from .entity import Entity, boolean_property, int_property
 from .enums import AuraType, CardType, PlayReq, Race, Zone
+from .logging import get_logger
 from .managers import *
-from .utils import CardList
+from .utils import CardList, IdentityDict
+
+
+log = get_logger(__name__)
 
 
 THE_COIN = "GAME_005"
@@ -32,11 +35,12 @@ class BaseCard(Entity):
 	atk = int_property("atk")
 	max_health = int_property("max_health")
 	cost = int_property("cost")
+	controller = None
 
 	def __init__(self, id, data):
 		self.data = data
 		super().__init__()
-		self._auras = []
+		self._auras = CardList()
 		self.requirements = data.requirements.copy()
 		self.entourage = CardList(self.data.entourage)
 		self.id = id
@@ -63,7 +67,11 @@ class BaseCard(Entity):
 
 	@property
 	def game(self):
-		return self.controller.game
+		controller = self.controller
+		if controller is None:
+			# Cards are in no game until they are given a controller
+			return None
+		return controller.game
 
 	@property
 	def zone(self):
@@ -76,7 +84,7 @@ class BaseCard(Entity):
 	def _set_zone(self, value):
 		old = self.zone
 		assert old != value
-		logging.debug("%r moves from %r to %r" % (self, old, value))
+		log.debug("%r moves from %r to %r", self, old, value)
 		caches = {
 			Zone.HAND: self.controller.hand,
 			Zone.DECK: self.controller.deck,
@@ -87,6 +95,21 @@ class BaseCard(Entity):
 			caches[value].append(self)
 		self._zone = value
 
+		if value == Zone.PLAY:
+			self.game.mark_death_candidate(self)
+
+		# Auras target cards in hand, minions and weapons
+		for zone in (old, value):
+			if zone == Zone.HAND or self.type in (CardType.MINION, CardType.WEAPON):
+				self.game.invalidate_auras(zone)
+
+		# Event listeners are only active in their own zone
+		for event in self._events:
+			if event.zone == old:
+				self.game.event_listeners.remove(self, event)
+			elif event.zone == value:
+				self.game.event_listeners.add(self, event)
+
 		if value == Zone.PLAY:
 			for aura in self.data.auras:
 				aura = Aura(aura, source=self)
@@ -97,8 +120,8 @@ class BaseCard(Entity):
 				aura.destroy()
 
 	def summon(self):
-		logging.info("Summoning %r", self)
-		self.order_of_play = new_order_of_play()
+		log.info("Summoning %r", self)
+		self.order_of_play = self.game.manager.new_order_of_play()
 		self.zone = Zone.PLAY
 
 	def buff(self, target, buff, **kwargs):
@@ -106,7 +129,7 @@ class BaseCard(Entity):
 		Summon \a buff and apply it to \a target
 		If keyword arguments are given, attempt to set the given
 		values to the buff. Example:
-		player.buff(target, health=random.randint(1, 5))
+		player.buff(target, health=game.random.randint(1, 5))
 		NOTE: Any Card can buff any other Card. The controller of the
 		Card that buffs the target becomes the controller of the buff.
 		"""
@@ -168,6 +191,10 @@ class PlayableCard(BaseCard):
 	@to_be_destroyed.setter
 	def to_be_destroyed(self, value):
 		self._to_be_destroyed = value
+		if self.zone == Zone.PLAY:
+			self.game.invalidate_auras(Zone.PLAY)
+			if value:
+				self.game.mark_death_candidate(self)
 
 	@property
 	def entities(self):
@@ -192,17 +219,17 @@ class PlayableCard(BaseCard):
 		if self.target:
 			kwargs["target"] = self.target
 		elif PlayReq.REQ_TARGET_IF_AVAILABLE in self.requirements:
-			logging.info("%r has no target, action exits early" % (self))
+			log.info("%r has no target, action exits early", self)
 			return
 
 		if self.has_combo and self.controller.combo:
-			logging.info("Activating %r combo targeting %r" % (self, self.target))
+			log.info("Activating %r combo targeting %r", self, self.target)
 			actions = self.data.scripts.combo
 		elif hasattr(self.data.scripts, "action"):
-			logging.info("Activating %r action targeting %r" % (self, self.target))
+			log.info("Activating %r action targeting %r", self, self.target)
 			actions = self.data.scripts.action
 		elif self.choose:
-			logging.info("Activating %r Choose One: %r", self, self.chosen)
+			log.info("Activating %r Choose One: %r", self, self.chosen)
 			actions = self.chosen.data.scripts.action
 		else:
 			return
@@ -218,7 +245,7 @@ class PlayableCard(BaseCard):
 
 	def clear_buffs(self):
 		if self.buffs:
-			logging.info("Clearing buffs from %r" % (self))
+			log.info("Clearing buffs from %r", self)
 			for buff in self.buffs[:]:
 				buff.destroy()
 
@@ -232,21 +259,21 @@ class PlayableCard(BaseCard):
 		be moved to the GRAVEYARD on the next Death event.
 		"""
 		if self.zone == Zone.PLAY:
-			logging.info("Marking %r for imminent death", self)
+			log.info("Marking %r for imminent death", self)
 			self.to_be_destroyed = True
 		else:
 			self.zone = Zone.GRAVEYARD
 
 	def discard(self):
-		logging.info("Discarding %r" % (self))
+		log.info("Discarding %r", self)
 		self.zone = Zone.GRAVEYARD
 
 	def draw(self):
 		if len(self.controller.hand) >= self.controller.max_hand_size:
-			logging.info("%s overdraws and loses %r!", self.controller, self)
+			log.info("%s overdraws and loses %r!", self.controller, self)
 			self.destroy()
 		else:
-			logging.info("%s draws %r", self.controller, self)
+			log.info("%s draws %r", self.controller, self)
 			self.zone = Zone.HAND
 			self.controller.cards_drawn_this_turn += 1
 
@@ -254,10 +281,16 @@ class PlayableCard(BaseCard):
 		return self.game.queue_actions(self, [Heal(target, amount)])
 
 	def hit(self, target, amount):
+		return self.game.run(self.resolve_hit(target, amount))
+
+	def resolve_hit(self, target, amount):
+		"""
+		Frame (see Game.run()) of \a self hitting \a target for \a amount.
+		"""
 		if getattr(target, "immune", False):
-			logging.info("%r is immune to %i damage from %r" % (target, amount, self))
+			log.info("%r is immune to %i damage from %r", target, amount, self)
 			return
-		return self.game.queue_actions(self, [Damage(target, amount)])
+		return (yield self.game.resolve_actions(self, [Damage(target, amount)]))
 
 	def is_playable(self):
 		if not self.controller.current_player:
@@ -392,17 +425,25 @@ class Character(PlayableCard):
 		amount = max(0, amount)
 		dmg = self.damage
 		if amount < dmg:
-			logging.info("%r healed for %i health" % (self, dmg - amount))
+			log.info("%r healed for %i health", self, dmg - amount)
 		elif amount == dmg:
-			logging.info("%r receives a no-op health change" % (self))
+			log.info("%r receives a no-op health change", self)
 		else:
-			logging.info("%r damaged for %i health" % (self, amount - dmg))
+			log.info("%r damaged for %i health", self, amount - dmg)
 
 		if self.min_health:
-			logging.info("%r has HEALTH_MINIMUM of %i", self, self.min_health)
+			log.info("%r has HEALTH_MINIMUM of %i", self, self.min_health)
 			amount = min(amount, self.max_health - self.min_health)
 
+		if self.type == CardType.MINION and self.zone == Zone.PLAY:
+			# Dead minions are not valid aura targets
+			max_health = self.max_health
+			if (dmg >= max_health) != (amount >= max_health):
+				self.game.invalidate_auras(Zone.PLAY)
+
 		self._damage = amount
+		if amount > dmg and self.zone == Zone.PLAY:
+			self.game.mark_death_candidate(self)
 
 	@property
 	def health(self):
@@ -451,7 +492,7 @@ class Hero(Character):
 	def attack(self, target):
 		ret = super().attack(target)
 		if self.controller.weapon:
-			logging.info("%r loses 1 durability", self.controller.weapon)
+			log.info("%r loses 1 durability", self.controller.weapon)
 			self.controller.weapon.damage += 1
 
 		return ret
@@ -530,7 +571,7 @@ class Minion(Character):
 			self.controller.field.append(self)
 
 		if self.zone == Zone.PLAY:
-			logging.info("%r is removed from the field" % (self))
+			log.info("%r is removed from the field", self)
 			self.controller.field.remove(self)
 			if self.damage:
 				self.damage = 0
@@ -538,33 +579,34 @@ class Minion(Character):
 		super()._set_zone(value)
 
 	def bounce(self):
-		logging.info("%r is bounced back to %s's hand" % (self, self.controller))
+		log.info("%r is bounced back to %s's hand", self, self.controller)
 		if len(self.controller.hand) == self.controller.max_hand_size:
-			logging.info("%s's hand is full and bounce fails" % (self.controller))
+			log.info("%s's hand is full and bounce fails", self.controller)
 			self.destroy()
 		else:
 			self.zone = Zone.HAND
 
-	def hit(self, target, amount):
-		super().hit(target, amount)
+	def resolve_hit(self, target, amount):
+		ret = yield from super().resolve_hit(target, amount)
 		if self.stealthed:
 			self.stealthed = False
+		return ret
 
 	def _hit(self, source, amount):
 		if self.divine_shield:
 			self.divine_shield = False
-			logging.info("%r's divine shield prevents %i damage. Divine shield fades.", self, amount)
+			log.info("%r's divine shield prevents %i damage. Divine shield fades.", self, amount)
 			return
 
 		if getattr(source, "poisonous", False):
-			logging.info("%r is destroyed because of %r is poisonous", self, source)
+			log.info("%r is destroyed because of %r is poisonous", self, source)
 			self.destroy()
 
 		return super()._hit(source, amount)
 
 	def morph(self, id):
 		into = self.game.card(id)
-		logging.info("Morphing %r into %r", self, into)
+		log.info("Morphing %r into %r", self, into)
 		for buff in self.buffs:
 			# TODO: buff.setAside() instead
 			buff.destroy()
@@ -580,7 +622,7 @@ class Minion(Character):
 		return playable
 
 	def silence(self):
-		logging.info("%r has been silenced" % (self))
+		log.info("%r has been silenced", self)
 		for aura in self._auras:
 			aura.destroy()
 		self.clear_buffs()
@@ -590,7 +632,10 @@ class Minion(Character):
 				setattr(self, attr, False)
 
 		# Wipe the event listeners
-		self._events = []
+		for event in self._events:
+			if event.zone == self.zone:
+				self.game.event_listeners.remove(self, event)
+		self._events = CardList()
 		self.silenced = True
 
 	def summon(self):
@@ -606,10 +651,10 @@ class Spell(PlayableCard):
 		self.immune_to_spellpower = False
 		super().__init__(*args)
 
-	def hit(self, target, amount):
+	def resolve_hit(self, target, amount):
 		if not self.immune_to_spellpower:
 			amount = self.controller.get_spell_damage(amount)
-		super().hit(target, amount)
+		return (yield from super().resolve_hit(target, amount))
 
 
 class Secret(Spell):
@@ -648,26 +693,31 @@ class Enchantment(BaseCard):
 			self.owner.buffs.append(self)
 		elif zone == Zone.GRAVEYARD:
 			self.owner.buffs.remove(self)
+		if zone in (Zone.PLAY, Zone.GRAVEYARD) and self.owner.zone == Zone.PLAY:
+			# Health and durability buffs can make their owner lethal
+			self.game.mark_death_candidate(self.owner)
 		super()._set_zone(zone)
 
 	def apply(self, target):
-		logging.info("Applying %r to %r" % (self, target))
+		log.info("Applying %r to %r", self, target)
 		self.owner = target
 		if hasattr(self.data.scripts, "apply"):
 			self.data.scripts.apply(self, target)
 		if hasattr(self.data.scripts, "max_health"):
-			logging.info("%r removes all damage from %r", self, target)
+			log.info("%r removes all damage from %r", self, target)
 			target.damage = 0
 		self.zone = Zone.PLAY
 
 	def destroy(self):
-		logging.info("Destroying buff %r from %r" % (self, self.owner))
+		log.info("Destroying buff %r from %r", self, self.owner)
 		if hasattr(self.data.scripts, "destroy"):
 			self.data.scripts.destroy(self)
 		self.zone = Zone.GRAVEYARD
 		if self.aura_source:
 			# Clean up the buff from its source auras
 			self.aura_source._buffs.remove(self)
+			self.aura_source._buff_map.pop(self.owner, None)
+			self.aura_source.dirty = True
 	_destroy = destroy
 
 
@@ -675,8 +725,27 @@ class Aura(object):
 	"""
 	A virtual Card class which is only for the source of the Enchantment buff on
 	targets affected by an aura. It is only internal.
+
+	Auras are only re-evaluated when they are flagged dirty by a change which
+	could affect them (see Game.invalidate_auras), unless their requirements
+	depend on state which is not tracked, in which case they are dynamic and
+	re-evaluated on every refresh.
 	"""
 
+	# Requirements which only depend on the target's zone, controller and card data
+	STATIC_REQUIREMENTS = frozenset((
+		PlayReq.REQ_MINION_TARGET,
+		PlayReq.REQ_FRIENDLY_TARGET,
+		PlayReq.REQ_ENEMY_TARGET,
+		PlayReq.REQ_NONSELF_TARGET,
+		PlayReq.REQ_TARGET_WITH_RACE,
+		PlayReq.REQ_HERO_TARGET,
+		PlayReq.REQ_SPELL_TARGET,
+		PlayReq.REQ_SECRET_TARGET,
+		PlayReq.REQ_WEAPON_TARGET,
+		PlayReq.REQ_TARGET_HAS_BATTLECRY,
+	))
+
 	def __init__(self, obj, source):
 		self.id = obj["id"]
 		self.source = source
@@ -684,7 +753,17 @@ class Aura(object):
 		self.requirements = obj["requirements"].copy()
 		self._buffed = CardList()
 		self._buffs = CardList()
+		self._buff_map = IdentityDict()
+		# Auras are not entities, their containers are bound by hand
+		for container in (self._buffed, self._buffs, self._buff_map):
+			container._owner = self
 		self._auraType = obj["type"]
+		self.zone = {
+			AuraType.PLAY_AURA: Zone.PLAY,
+			AuraType.HAND_AURA: Zone.HAND,
+		}.get(self._auraType)
+		self.dirty = True
+		self.dynamic = self._is_dynamic()
 
 	def __repr__(self):
 		return "<Aura (%r)>" % (self.id)
@@ -693,6 +772,17 @@ class Aura(object):
 	def game(self):
 		return self.source.game
 
+	def _is_dynamic(self):
+		if self._auraType == AuraType.PLAYER_AURA:
+			return False
+		if not self.requirements.keys() <= self.STATIC_REQUIREMENTS:
+			return True
+		if PlayReq.REQ_FRIENDLY_TARGET not in self.requirements:
+			# Stealth and immunity of enemy minions are not tracked
+			return True
+		# Targeting restrictions against spells and hero powers are not tracked
+		return self.source.type in (CardType.SPELL, CardType.HERO_POWER)
+
 	def is_valid_target(self, target):
 		if self._auraType == AuraType.PLAYER_AURA:
 			return target == self.controller
@@ -716,8 +806,8 @@ class Aura(object):
 		return ret
 
 	def summon(self):
-		logging.info("Summoning Aura %r", self)
-		self.order_of_play = new_order_of_play()
+		log.info("Summoning Aura %r", self)
+		self.order_of_play = self.game.manager.new_order_of_play()
 		self.game.auras.append(self)
 		self.game.refresh_auras()
 
@@ -725,15 +815,18 @@ class Aura(object):
 		buff = self.source.buff(target, self.id)
 		buff.aura_source = self
 		self._buffs.append(buff)
-		self._buffed.append(target)
+		self._buff_map[target] = buff
+		if target not in self._buffed:
+			self._buffed.append(target)
 
 	def _entity_buff(self, target):
 		"Returns the buff created by this aura on \a target"
-		for buff in target.buffs:
-			if buff.aura_source is self:
-				return buff
+		return self._buff_map.get(target)
 
 	def update(self):
+		# Changes made by the update itself flag the aura again, which
+		# costs at most one extra pass on the next refresh.
+		self.dirty = False
 		for target in self.targets:
 			if target.type == CardType.ENCHANTMENT:
 				# HACKY: self.targets currently relies on hero entities
@@ -752,12 +845,10 @@ class Aura(object):
 				self._buffed.remove(target)
 
 	def destroy(self):
-		logging.info("Removing %r affecting %r" % (self, self._buffed))
+		log.info("Removing %r affecting %r", self, self._buffed)
 		self.game.auras.remove(self)
 		for buff in self._buffs[:]:
 			buff.destroy()
-		del self._buffs
-		del self._buffed
 		self.source._auras.remove(self)
 
 
@@ -781,6 +872,16 @@ class Weapon(PlayableCard):
 		super().__init__(*args)
 		self.damage = 0
 
+	@property
+	def damage(self):
+		return getattr(self, "_damage", 0)
+
+	@damage.setter
+	def damage(self, value):
+		self._damage = value
+		if self.zone == Zone.PLAY:
+			self.game.mark_death_candidate(self)
+
 	@property
 	def durability(self):
 		ret = getattr(self, "_durability", 0)
@@ -791,6 +892,8 @@ class Weapon(PlayableCard):
 	@durability.setter
 	def durability(self, value):
 		self._durability = value
+		if self.zone == Zone.PLAY:
+			self.game.mark_death_candidate(self)
 
 	@property
 	def exhausted(self):
@@ -807,6 +910,8 @@ class Weapon(PlayableCard):
 	@to_be_destroyed.setter
 	def to_be_destroyed(self, value):
 		self._to_be_destroyed = value
+		if value and self.zone == Zone.PLAY:
+			self.game.mark_death_candidate(self)
 
 	def _set_zone(self, zone):
 		if self.zone == Zone.PLAY:
@@ -834,9 +939,9 @@ class HeroPower(PlayableCard):
 		if actions:
 			return self.game.queue_actions(self, actions)
 
-	def hit(self, target, amount):
+	def resolve_hit(self, target, amount):
 		amount *= (self.controller.hero_power_double + 1)
-		super().hit(target, amount)
+		return (yield from super().resolve_hit(target, amount))
 
 	def is_playable(self):
 		return False
@@ -846,12 +951,13 @@ class HeroPower(PlayableCard):
 
 	def use(self, target=None):
 		assert self.is_usable()
-		logging.info("%s uses hero power %r on %r", self.controller, self, target)
+		log.info("%s uses hero power %r on %r", self.controller, self, target)
 
 		if self.has_target():
 			assert target
 			self.target = target
 
+		self.game.manager.hero_power(self, target)
 		ret = self.activate()
 
 		self.exhausted = True
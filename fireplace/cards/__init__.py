@@ -27,6 +27,24 @@ def merge(id):
 	return card
 
 
+# Card attributes which are indexed for filter()
+INDEXED_ATTRIBUTES = (
+	"collectible", "type", "card_class", "race", "rarity", "cost", "card_set", "spare_part",
+)
+
+
+def _build_indexes():
+	"""
+	Build a {attr: {value: {id, ...}}} index of the card database for
+	every attribute in INDEXED_ATTRIBUTES.
+	"""
+	indexes = {attr: {} for attr in INDEXED_ATTRIBUTES}
+	for card in db.values():
+		for attr, index in indexes.items():
+			index.setdefault(getattr(card, attr), set()).add(card.id)
+	return indexes
+
+
 def filter(**kwargs):
 	"""
 	Returns a list of card IDs matching the given filters. Each filter, if not
@@ -37,14 +55,29 @@ def filter(**kwargs):
 	\a race: The race (tribe) of the card (fireplace.enums.Race)
 	\a rarity: The rarity of the card (fireplace.enums.Rarity)
 	\a cost: The mana cost of the card
+	Indexed attributes are looked up in the indexes and intersected, any
+	other attribute is matched against the remaining cards.
 	"""
-	cards = db.values()
-
+	matches = []
+	unindexed = []
 	for attr, value in kwargs.items():
-		if value is not None:
-			# What? this doesn't work?
-			# cards = __builtins__["filter"](lambda c: getattr(c, attr) == value, cards)
-			cards = [card for card in cards if getattr(card, attr) == value]
+		if value is None:
+			continue
+		if attr in indexes:
+			matches.append(indexes[attr].get(value, ()))
+		else:
+			unindexed.append((attr, value))
+
+	if matches:
+		matches.sort(key=len)
+		ids = set(matches[0]).intersection(*matches[1:])
+		# Keep the order of the card database
+		cards = [db[id] for id in sorted(ids, key=positions.__getitem__)]
+	else:
+		cards = db.values()
+
+	for attr, value in unindexed:
+		cards = [card for card in cards if getattr(card, attr) == value]
 
 	return [card.id for card in cards]
 
@@ -59,9 +92,13 @@ if "cardlist" not in globals():
 	if not os.path.exists(xmlfile):
 		raise RuntimeError("%r does not exist - generate it!" % (xmlfile))
 
-	with open(xmlfile, "r") as f:
-		db, xml = cardxml.load(xmlfile)
-		cardlist = []
-		for id in db:
-			globals()[id] = merge(id)
-			cardlist.append(id)
+	# The compiled database is only used if it matches the XML contents,
+	# otherwise the XML is parsed and the database regenerated.
+	dbfile = resource_filename(__name__, "enUS.db")
+	db = cardxml.load_cached(xmlfile, dbfile)
+	cardlist = []
+	for id in db:
+		globals()[id] = merge(id)
+		cardlist.append(id)
+	positions = {id: i for i, id in enumerate(cardlist)}
+	indexes = _build_indexes()
@@ -117,4 +117,4 @@ class BRM_017:
 	def action(self):
 		minions = self.game.minions_killed.filter(controller=self.controller)
 		if minions:
-			return [Summon(CONTROLLER, random.choice(minions).id)]
+			return [Summon(CONTROLLER, self.game.random.choice(minions).id)]
@@ -114,7 +114,7 @@ class EX1_617:
 # Animal Companion
 class NEW1_031:
 	def action(self):
-		huffer = random.choice(self.data.entourage)
+		huffer = self.game.random.choice(self.data.entourage)
 		return [Summon(CONTROLLER, huffer)]
 
 
@@ -35,7 +35,7 @@ class EX1_062:
 # Tinkmaster Overspark
 class EX1_083:
 	def action(self):
-		choice = random.choice(("EX1_tk28", "EX1_tk29"))
+		choice = self.game.random.choice(("EX1_tk28", "EX1_tk29"))
 		return [Morph(RANDOM_MINION, choice)]
 
 
@@ -56,7 +56,7 @@ class EX1_110:
 # Gelbin Mekkatorque
 class EX1_112:
 	def action(self):
-		choice = random.choice(self.data.entourage)
+		choice = self.game.random.choice(self.data.entourage)
 		return [Summon(CONTROLLER, choice)]
 
 # Homing Chicken
@@ -107,7 +107,7 @@ class EX1_298:
 class EX1_557:
 	events = [
 		OWN_TURN_BEGIN.on(
-			lambda self, player: random.randint(0, 1) and [Draw(CONTROLLER)] or []
+			lambda self, player: self.game.random.randint(0, 1) and [Draw(CONTROLLER)] or []
 		)
 	]
 
@@ -200,14 +200,14 @@ class NEW1_040:
 # Elite Tauren Chieftain
 class PRO_001:
 	def action(self):
-		choice1 = random.choice(self.data.entourage)
-		choice2 = random.choice(self.data.entourage)
+		choice1 = self.game.random.choice(self.data.entourage)
+		choice2 = self.game.random.choice(self.data.entourage)
 		return [Give(CONTROLLER, choice1), Give(OPPONENT, choice2)]
 
 # I Am Murloc
 class PRO_001a:
 	def action(self):
-		return [Summon(CONTROLLER, "PRO_001at") * random.choice((3, 4, 5))]
+		return [Summon(CONTROLLER, "PRO_001at") * self.game.random.choice((3, 4, 5))]
 
 # Rogues Do It...
 class PRO_001b:
@@ -217,5 +217,5 @@ class PRO_001b:
 # Power of the Horde
 class PRO_001c:
 	def action(self):
-		choice = random.choice(self.data.entourage)
+		choice = self.game.random.choice(self.data.entourage)
 		return [Summon(CONTROLLER, choice)]
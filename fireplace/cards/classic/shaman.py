@@ -8,7 +8,7 @@ from ..utils import *
 class CS2_049:
 	def activate(self):
 		totems = [t for t in self.entourage if not self.controller.field.contains(t)]
-		return [Summon(CONTROLLER, random.choice(totems))]
+		return [Summon(CONTROLLER, self.game.random.choice(totems))]
 
 # Healing Totem
 class NEW1_009:
@@ -123,4 +123,4 @@ class EX1_245:
 # Lightning Storm
 class EX1_259:
 	def action(self):
-		return [Hit(target, random.choice((2, 3))) for target in self.controller.opponent.field]
+		return [Hit(target, self.game.random.choice((2, 3))) for target in self.controller.opponent.field]
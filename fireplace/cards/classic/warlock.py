@@ -151,7 +151,7 @@ class EX1_317:
 		for i in range(2):
 			demons = self.controller.deck.filter(race=Race.DEMON)
 			if demons:
-				yield Draw(CONTROLLER, random.choice(demons))
+				yield Draw(CONTROLLER, self.game.random.choice(demons))
 			else:
 				yield Draw(CONTROLLER, "EX1_317t")
 
@@ -36,7 +36,7 @@ class GVG_106:
 class GVG_107:
 	def action(self):
 		for target in self.controller.field.exclude(self):
-			tag = random.choice((GameTag.WINDFURY, GameTag.TAUNT, GameTag.DIVINE_SHIELD))
+			tag = self.game.random.choice((GameTag.WINDFURY, GameTag.TAUNT, GameTag.DIVINE_SHIELD))
 			yield SetTag(target, {tag: True})
 
 
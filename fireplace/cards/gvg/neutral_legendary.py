@@ -11,7 +11,7 @@ class GVG_110:
 # Boom Bot
 class GVG_110t:
 	def deathrattle(self):
-		return [Hit(RANDOM_ENEMY_CHARACTER, random.randint(1, 4))]
+		return [Hit(RANDOM_ENEMY_CHARACTER, self.game.random.randint(1, 4))]
 
 
 # Sneed's Old Shredder
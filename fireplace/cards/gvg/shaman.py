@@ -37,7 +37,7 @@ class GVG_029:
 # Crackle
 class GVG_038:
 	def action(self, target):
-		return [Hit(TARGET, random.randint(3, 6))]
+		return [Hit(TARGET, self.game.random.randint(3, 6))]
 
 
 ##
@@ -1,4 +1,3 @@
-import random
 from ..actions import *
 from ..enums import CardClass, CardType, GameTag, Race, Rarity, Zone
 from ..events import *
@@ -1,26 +1,45 @@
+import hashlib
+import os
+import pickle
+import sys
 from xml.etree import ElementTree
 from fireplace.enums import *
 
 
+# Bump this whenever the layout of CardXML changes, to invalidate old caches.
+CACHE_VERSION = 2
+
+
 class CardXML(object):
+	"""
+	Compact record of a card's data, parsed from its XML Entity element.
+	The element itself is not kept around once parsed.
+	"""
+	__slots__ = (
+		"id", "tags", "hero_power", "requirements", "powerup_requirements",
+		"enrage_tags", "auras", "choose_cards", "entourage", "scripts",
+		"name", "description", "card_class", "card_set", "collectible",
+		"cost", "faction", "race", "rarity", "type", "secret", "spare_part",
+	)
+
 	def __init__(self, xml):
-		self.xml = xml
-		e = self.xml.findall("./Tag")
+		self.id = xml.attrib["CardID"]
+		e = xml.findall("./Tag")
 		self.tags = {GameTag(int(tag.attrib["enumID"])): self._get_tag(tag) for tag in e}
 
-		e = self.xml.findall("HeroPower")
+		e = xml.findall("HeroPower")
 		self.hero_power = e and e[0].attrib["cardID"] or None
 
-		e = self.xml.findall("Power[PlayRequirement]/PlayRequirement")
+		e = xml.findall("Power[PlayRequirement]/PlayRequirement")
 		self.requirements = self._getRequirements(e)
 
-		e = self.xml.findall("PowerUpRequirement")
+		e = xml.findall("PowerUpRequirement")
 		self.powerup_requirements = [Race(int(tag.attrib["param"])) for tag in e]
 
-		e = self.xml.findall("./EnrageDefinition/Tag")
+		e = xml.findall("./EnrageDefinition/Tag")
 		self.enrage_tags = {GameTag(int(tag.attrib["enumID"])): self._get_tag(tag) for tag in e}
 
-		e = self.xml.findall("Aura")
+		e = xml.findall("Aura")
 		self.auras = [{
 			"id": tag.attrib["cardID"],
 			"requirements": self._getRequirements(tag.findall("ActiveRequirement")),
@@ -30,15 +49,27 @@ class CardXML(object):
 		self.choose_cards = [tag.attrib["cardID"] for tag in xml.findall("ChooseCard")]
 		self.entourage = [tag.attrib["cardID"] for tag in xml.findall("EntourageCard")]
 
+		# Precompute the commonly accessed tags
+		tags = self.tags
+		self.name = tags.get(GameTag.CARDNAME, "")
+		self.description = tags.get(GameTag.CARDTEXT_INHAND, "")
+		self.card_class = CardClass(tags.get(GameTag.CLASS, 0))
+		self.card_set = CardSet(tags.get(GameTag.CARD_SET, 0))
+		self.collectible = bool(tags.get(GameTag.Collectible, False))
+		self.cost = tags.get(GameTag.COST, 0)
+		self.faction = Faction(tags.get(GameTag.FACTION, 0))
+		self.race = Race(tags.get(GameTag.CARDRACE, 0))
+		self.rarity = Rarity(tags.get(GameTag.RARITY, 0))
+		self.type = CardType(tags.get(GameTag.CARDTYPE, 0))
+		self.secret = bool(tags.get(GameTag.SECRET, False))
+		self.spare_part = bool(tags.get(GameTag.SPARE_PART, False))
+
 	def __str__(self):
 		return self.name
 
 	def __repr__(self):
 		return "<%s: %r>" % (self.id, self.name)
 
-	def _findTag(self, id):
-		return self.xml.findall('./Tag[@enumID="%i"]' % (id))
-
 	def _get_tag(self, element):
 		type = element.attrib.get("type", "Int")
 
@@ -57,64 +88,59 @@ class CardXML(object):
 	def _getRequirements(self, reqs):
 		return {PlayReq(int(tag.attrib["reqID"])): int(tag.attrib["param"] or 0) for tag in reqs}
 
-	@property
-	def id(self):
-		return self.xml.attrib["CardID"]
-
-	@property
-	def name(self):
-		return self.tags[GameTag.CARDNAME]
-
-	@property
-	def description(self):
-		return self.tags.get(GameTag.CARDTEXT_INHAND, "")
-
-	@property
-	def card_class(self):
-		return CardClass(self.tags.get(GameTag.CLASS, 0))
-
-	@property
-	def card_set(self):
-		return CardSet(self.tags.get(GameTag.CARD_SET, 0))
-
-	@property
-	def collectible(self):
-		return bool(self.tags.get(GameTag.Collectible, False))
-
-	@property
-	def cost(self):
-		return self.tags.get(GameTag.COST, 0)
-
-	@property
-	def faction(self):
-		return Faction(self.tags.get(GameTag.FACTION, 0))
-
-	@property
-	def race(self):
-		return Race(self.tags.get(GameTag.CARDRACE, 0))
-
-	@property
-	def rarity(self):
-		return Rarity(self.tags.get(GameTag.RARITY, 0))
-
-	@property
-	def type(self):
-		return CardType(self.tags.get(GameTag.CARDTYPE, 0))
-
-	@property
-	def secret(self):
-		return bool(self.tags.get(GameTag.SECRET, False))
-
-	@property
-	def spare_part(self):
-		return bool(self.tags.get(GameTag.SPARE_PART, False))
-
 
 def load(path):
 	db = {}
 	with open(path, "r", encoding="utf8") as f:
-		xml = ElementTree.parse(f)
-		for carddata in xml.findall("Entity"):
+		for carddata in ElementTree.parse(f).findall("Entity"):
 			card = CardXML(carddata)
 			db[card.id] = card
-	return db, xml
+	return db
+
+
+def _header(path):
+	with open(path, "rb") as f:
+		return CACHE_VERSION, hashlib.sha1(f.read()).hexdigest()
+
+
+def dump(db, header, cache):
+	"""
+	Write the card database \a db in binary form to \a cache.
+	"""
+	tmp = "%s.%i.tmp" % (cache, os.getpid())
+	with open(tmp, "wb") as f:
+		pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+		pickle.dump(db, f, pickle.HIGHEST_PROTOCOL)
+	# Atomic, so that concurrent workers never read a partial cache
+	os.replace(tmp, cache)
+
+
+def load_cached(path, cache):
+	"""
+	Load the card database from \a cache if it is up to date with the XML
+	file at \a path (the cache is keyed by the hash of the XML contents).
+	Otherwise, parse the XML and try to regenerate the cache.
+	"""
+	header = _header(path)
+	try:
+		with open(cache, "rb") as f:
+			if pickle.load(f) == header:
+				return pickle.load(f)
+	except (OSError, EOFError, pickle.UnpicklingError):
+		pass
+
+	db = load(path)
+	try:
+		dump(db, header, cache)
+	except OSError:
+		# Read-only installation, the XML will be parsed every time
+		pass
+	return db
+
+
+if __name__ == "__main__":
+	if len(sys.argv) != 3:
+		sys.stderr.write("Usage: %s <enUS.xml> <enUS.db>\n" % (sys.argv[0]))
+		sys.exit(1)
+	db = load(sys.argv[1])
+	dump(db, _header(sys.argv[1]), sys.argv[2])
@@ -1,8 +1,8 @@
 from .card import Card
-from .utils import CardList
+from .utils import ZoneList
 
 
-class Deck(CardList):
+class Deck(ZoneList):
 	MAX_CARDS = 30
 	MAX_UNIQUE_CARDS = 2
 	MAX_UNIQUE_LEGENDARIES = 1
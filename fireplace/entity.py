@@ -1,10 +1,41 @@
 import uuid
+from copy import deepcopy
+from .utils import CardList, CardView, IdentityDict, invalidate_caches
 
-order_of_play = 0;
+# Derived stats (see int_property and boolean_property) and views (see
+# cached_view) are cached until the next write which changes an attribute
+# of an entity of their game, which bumps the game's _state_version. Every
+# input to them (zones, controllers, buffs, silence, damage, script inputs
+# such as the board) is stored on an entity. Entities outside of a game are
+# not cached.
+
+# Set to True to check every cached value against a full recomputation.
+VERIFY_CACHED_STATS = False
+
+# Placeholder for attributes which did not exist before a journaled write
+_MISSING = object()
+
+# Entity attributes which are never modified and can be shared between copies
+_SHARED_ATTRIBUTES = frozenset(("data", ))
+# Entity attributes which are not part of the state of the game, and are
+# neither copied nor pickled (see Game.checkpoint() for the journal)
+_LOCAL_ATTRIBUTES = frozenset(("_cache", "_journal"))
+# Entity attributes which no derived stat nor view depends on: writing them
+# does not invalidate the caches (they are still journaled)
+_UNCACHED_ATTRIBUTES = frozenset(("next_step", "order_of_play", "step", "target"))
+_IMMUTABLE_TYPES = frozenset((bool, int, float, str, type(None)))
+
+# {(class, attribute): whether the attribute is a property with a setter}
+_setters = {}
+
+
+def _has_setter(cls, name):
+	key = (cls, name)
+	ret = _setters.get(key)
+	if ret is None:
+		ret = _setters[key] = hasattr(type(getattr(cls, name, None)), "__set__")
+	return ret
 
-def new_order_of_play():
-	order_of_play += 1;
-	return order_of_play
 
 class Entity(object):
 	def __init__(self):
@@ -15,7 +46,117 @@ class Entity(object):
 		self.order_of_play = -1
 
 		scripts = getattr(self.data, "scripts", None)
-		self._events = getattr(scripts, "events", [])[:]
+		self._events = CardList(getattr(scripts, "events", []))
+		self._cache = {}
+
+	def __deepcopy__(self, memo):
+		"""
+		Copies share the immutable card data and event listener definitions
+		with the original entity, and get a uuid of their own.
+		"""
+		cls = self.__class__
+		ret = cls.__new__(cls)
+		memo[id(self)] = ret
+		attrs = ret.__dict__
+		for k, v in self.__dict__.items():
+			if k in _LOCAL_ATTRIBUTES:
+				continue
+			if k in _SHARED_ATTRIBUTES or type(v) in _IMMUTABLE_TYPES:
+				attrs[k] = v
+			else:
+				attrs[k] = deepcopy(v, memo)
+		attrs["_events"] = CardList(self._events)
+		attrs["_events"]._owner = ret
+		attrs["_cache"] = {}
+		attrs["uuid"] = uuid.uuid4()
+		return ret
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for k in _LOCAL_ATTRIBUTES:
+			state.pop(k, None)
+		return state
+
+	def __setstate__(self, state):
+		# Restored directly, without going through properties
+		self.__dict__.update(state)
+		self.__dict__["_cache"] = {}
+
+	def __setattr__(self, name, value):
+		immutable = type(value) in _IMMUTABLE_TYPES
+		if not immutable and isinstance(value, (CardList, IdentityDict)) and value._owner is None:
+			# Changes to the container are changes to the entity's game
+			value._owner = self
+		old = self.__dict__.get(name, _MISSING)
+		# Attributes already set on the entity are never properties
+		setter = old is _MISSING and _has_setter(self.__class__, name)
+		if old is value or (immutable and old == value and type(old) is type(value)):
+			# Not a change: nothing to invalidate, journal or report
+			return
+		game = getattr(self, "game", None)
+		manager = self.__dict__.get("manager")
+		tag = None
+		# Entities outside of a game may be joining one (eg. given a controller)
+		if manager is not None and (game is None or game.manager.track_tags):
+			tag = manager.attribute_tags().get(name)
+		if tag is not None:
+			self._set_tag(tag, name, value)
+		else:
+			super().__setattr__(name, value)
+		if game is not None and not setter:
+			# Properties store their state in plain attributes, which are
+			# invalidated and journaled when the setter writes them
+			if name not in _UNCACHED_ATTRIBUTES:
+				invalidate_caches(game)
+			journal = game._journal
+			if journal is not None:
+				journal.record(self, name, old)
+
+	def _set_tag(self, tag, name, value):
+		"""
+		Set the attribute \a name of \a tag, and report the new value to
+		the game's observers if it changed.
+		"""
+		old = None
+		if getattr(self, "game", None) is not None:
+			old = getattr(self, name, None)
+		super().__setattr__(name, value)
+		game = getattr(self, "game", None)
+		if game is None:
+			# Entities outside of a game (eg. being created) are not reported
+			return
+		value = getattr(self, name, None)
+		if value is not old and (isinstance(value, Entity) or value != old):
+			game.manager.tag_change(self, tag, value)
+
+	def _undo(self, name, value):
+		# Restored directly, without going through properties
+		if value is _MISSING:
+			self.__dict__.pop(name, None)
+		else:
+			self.__dict__[name] = value
+
+	def _cached(self, attr, compute):
+		"""
+		Return the value of \a attr, only calling \a compute(self)
+		if an entity of the game changed since it was last computed.
+		"""
+		game = getattr(self, "game", None)
+		if game is None:
+			return compute(self)
+		version = game._state_version
+		cached = self._cache.get(attr)
+		if cached is not None and cached[1] == version:
+			if VERIFY_CACHED_STATS:
+				value = compute(self)
+				assert _identical(value, cached[0]), "%r: cached %s is %r, expected %r" % (
+					self, attr, cached[0], value
+				)
+			return cached[0]
+		value = compute(self)
+		# Stamped with the version from before computing, in case it changed
+		self._cache[attr] = (value, version)
+		return value
 
 	def _getattr(self, attr, i):
 		i += getattr(self, "_" + attr, 0)
@@ -26,6 +167,29 @@ class Entity(object):
 		return getattr(self.data.scripts, attr, lambda s, x: x)(self, i)
 
 
+def _identical(a, b):
+	if isinstance(a, list):
+		# Cards compare equal by id, views must hold the very same entities
+		return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+	return a == b
+
+
+def cached_view(func):
+	"""
+	Property decorator for a view of the game's entities, such as
+	Game.board. The view is cached until an entity of the game changes, so
+	it is returned as a read-only CardView shared by every caller.
+	"""
+	def compute(self):
+		return CardView(func(self))
+
+	@property
+	def view(self):
+		return self._cached(func.__name__, compute)
+
+	return view
+
+
 def slot_property(attr, f=any):
 	@property
 	def func(self):
@@ -34,12 +198,15 @@ def slot_property(attr, f=any):
 
 
 def boolean_property(attr):
-	@property
-	def func(self):
+	def compute(self):
 		return getattr(self, "_" + attr, False) \
 			or any(getattr(slot, attr, False) for slot in self.slots) \
 			or getattr(self.data.scripts, attr, lambda s, x: x)(self, False)
 
+	@property
+	def func(self):
+		return self._cached(attr, compute)
+
 	@func.setter
 	def func(self, value):
 		setattr(self, "_" + attr, value)
@@ -48,10 +215,12 @@ def boolean_property(attr):
 
 
 def int_property(attr):
+	def compute(self):
+		return max(0, self._getattr(attr, 0))
+
 	@property
 	def func(self):
-		ret = self._getattr(attr, 0)
-		return max(0, ret)
+		return self._cached(attr, compute)
 
 	@func.setter
 	def func(self, value):
@@ -0,0 +1,267 @@
+"""
+Compact binary log of the events of a game.
+
+EventLogWriter is a GameManager observer which appends the game's events
+to a file, and read_events() iterates them lazily from a memory-mapped
+copy of the file.
+
+The file starts with MAGIC, followed by records. Each record starts with
+its type (u8), followed by (all integers are little endian):
+- GAME: nothing. Starts the events of a game, several games can be
+  appended to the same file
+- SYMBOL: symbol id (u32), length (u16), UTF-8 string
+- NEW_ENTITY: entity id (u32), card id (symbol, u32)
+- ACTION: PowSubType (u8), action class name (symbol, u32), arguments (value)
+- ACTION_END: PowSubType (u8), action class name (symbol, u32)
+Actions without a PowSubType (eg. BeginTurn, EndTurn) are written with the
+subtype NO_SUBTYPE (0).
+- TAG_CHANGE: entity id (u32), tag (u16), value
+Strings (card IDs, names...) are only written once per game, in a SYMBOL
+record, and referred to by their symbol id afterwards.
+Values are their type (u8) followed by: nothing (NONE), i32 (INT), i64
+(LONG), an entity id (ENTITY, u32), a symbol (STRING, u32), a count (u16)
+and as many values (LIST), or the symbol of the class name of an object
+which cannot be encoded (OBJECT, u32).
+"""
+import mmap
+import struct
+from .entity import Entity
+from .managers import Observer
+
+
+MAGIC = b"FPEL\x01"
+
+# Record types
+SYMBOL = 0
+NEW_ENTITY = 1
+ACTION = 2
+ACTION_END = 3
+TAG_CHANGE = 4
+GAME = 5
+
+# PowSubType of the actions which have none
+NO_SUBTYPE = 0
+
+# Value types
+NONE = 0
+INT = 1
+LONG = 2
+ENTITY = 3
+STRING = 4
+LIST = 5
+OBJECT = 6
+
+BUFFER_SIZE = 64 * 1024
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_I64 = struct.Struct("<q")
+_SYMBOL = struct.Struct("<BIH")
+_NEW_ENTITY = struct.Struct("<BII")
+_ACTION = struct.Struct("<BBI")
+_TAG_CHANGE = struct.Struct("<BIH")
+_VALUE_U32 = struct.Struct("<BI")
+_VALUE_I32 = struct.Struct("<Bi")
+_VALUE_I64 = struct.Struct("<Bq")
+_VALUE_U16 = struct.Struct("<BH")
+
+
+class EntityRef(int):
+	"""
+	The id of an entity, as read from an event log.
+	"""
+	def __repr__(self):
+		return "<Entity %i>" % (self)
+
+
+class ObjectRef(str):
+	"""
+	The class name of an object which could not be encoded in an event log.
+	"""
+	def __repr__(self):
+		return "<%s>" % (str.__str__(self))
+
+
+def entity_id(entity):
+	"""
+	Returns the id given to \a entity by the GameManager, or 0 if it has none.
+	"""
+	return getattr(entity.manager, "id", 0)
+
+
+class EventLogWriter(Observer):
+	"""
+	GameManager observer which appends the events of a game to the event
+	log at \a path. Writes are buffered, call close() (or use the writer
+	as a context manager) once the game is over.
+	Usage: game.manager.register(EventLogWriter(path))
+	"""
+	def __init__(self, path, buffer_size=BUFFER_SIZE):
+		self.file = open(path, "ab")
+		self.buffer_size = buffer_size
+		self.buffer = bytearray()
+		self.symbols = {}
+		if not self.file.tell():
+			self.buffer += MAGIC
+		self.buffer.append(GAME)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def _symbol(self, string):
+		# Symbols are defined in the buffer, before the record using them
+		symbol = self.symbols.get(string)
+		if symbol is None:
+			symbol = self.symbols[string] = len(self.symbols)
+			data = string.encode("utf-8")
+			self.buffer += _SYMBOL.pack(SYMBOL, symbol, len(data))
+			self.buffer += data
+		return symbol
+
+	def _value(self, record, value):
+		if value is None:
+			record.append(NONE)
+		elif isinstance(value, int):
+			if -0x80000000 <= value <= 0x7fffffff:
+				record += _VALUE_I32.pack(INT, value)
+			else:
+				record += _VALUE_I64.pack(LONG, value)
+		elif isinstance(value, Entity):
+			record += _VALUE_U32.pack(ENTITY, entity_id(value))
+		elif isinstance(value, str):
+			record += _VALUE_U32.pack(STRING, self._symbol(value))
+		elif isinstance(value, (list, tuple)):
+			record += _VALUE_U16.pack(LIST, len(value))
+			for item in value:
+				self._value(record, item)
+		else:
+			record += _VALUE_U32.pack(OBJECT, self._symbol(value.__class__.__name__))
+
+	def _write(self, record):
+		self.buffer += record
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def _action(self, type, action):
+		subtype = action.type
+		if subtype is None:
+			subtype = NO_SUBTYPE
+		return _ACTION.pack(type, subtype, self._symbol(action.__class__.__name__))
+
+	def action(self, action, args):
+		record = bytearray(self._action(ACTION, action))
+		self._value(record, args)
+		self._write(record)
+
+	def action_end(self, action, args):
+		self._write(self._action(ACTION_END, action))
+
+	def new_entity(self, entity):
+		# The initial tags of a card are those of its card data
+		card_id = self._symbol(getattr(entity, "id", None) or "")
+		self._write(_NEW_ENTITY.pack(NEW_ENTITY, entity_id(entity), card_id))
+
+	def tag_change(self, entity, tag, value):
+		record = bytearray(_TAG_CHANGE.pack(TAG_CHANGE, entity_id(entity), tag))
+		self._value(record, value)
+		self._write(record)
+
+	def flush(self):
+		self.file.write(self.buffer)
+		self.file.flush()
+		del self.buffer[:]
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+
+def _read_value(data, offset, symbols):
+	type = data[offset]
+	offset += 1
+	if type == INT:
+		return _I32.unpack_from(data, offset)[0], offset + 4
+	elif type == ENTITY:
+		return EntityRef(_U32.unpack_from(data, offset)[0]), offset + 4
+	elif type == STRING:
+		return symbols[_U32.unpack_from(data, offset)[0]], offset + 4
+	elif type == NONE:
+		return None, offset
+	elif type == LIST:
+		count = _U16.unpack_from(data, offset)[0]
+		offset += 2
+		ret = []
+		for i in range(count):
+			value, offset = _read_value(data, offset, symbols)
+			ret.append(value)
+		return ret, offset
+	elif type == LONG:
+		return _I64.unpack_from(data, offset)[0], offset + 8
+	elif type == OBJECT:
+		return ObjectRef(symbols[_U32.unpack_from(data, offset)[0]]), offset + 4
+	raise ValueError("Invalid value type %i at offset %i" % (type, offset - 1))
+
+
+def _read_records(data):
+	if data[:len(MAGIC)] != MAGIC:
+		raise ValueError("Not an event log")
+	symbols = []
+	offset = len(MAGIC)
+	end = len(data)
+	while offset < end:
+		type = data[offset]
+		if type == ACTION:
+			type, subtype, name = _ACTION.unpack_from(data, offset)
+			args, offset = _read_value(data, offset + _ACTION.size, symbols)
+			yield (ACTION, subtype or None, symbols[name], args)
+		elif type == TAG_CHANGE:
+			type, entity, tag = _TAG_CHANGE.unpack_from(data, offset)
+			value, offset = _read_value(data, offset + _TAG_CHANGE.size, symbols)
+			yield (TAG_CHANGE, EntityRef(entity), tag, value)
+		elif type == ACTION_END:
+			type, subtype, name = _ACTION.unpack_from(data, offset)
+			offset += _ACTION.size
+			yield (ACTION_END, subtype or None, symbols[name])
+		elif type == NEW_ENTITY:
+			type, entity, card_id = _NEW_ENTITY.unpack_from(data, offset)
+			offset += _NEW_ENTITY.size
+			yield (NEW_ENTITY, EntityRef(entity), symbols[card_id])
+		elif type == SYMBOL:
+			type, symbol, length = _SYMBOL.unpack_from(data, offset)
+			offset += _SYMBOL.size
+			assert symbol == len(symbols)
+			symbols.append(bytes(data[offset:offset + length]).decode("utf-8"))
+			offset += length
+		elif type == GAME:
+			offset += 1
+			symbols = []
+			yield (GAME, )
+		else:
+			raise ValueError("Invalid record type %i at offset %i" % (type, offset))
+
+
+def read_events(path):
+	"""
+	Iterates over the events in the event log at \a path, as tuples:
+	- (GAME, ), before the events of each game
+	- (NEW_ENTITY, entity id, card id)
+	- (ACTION, PowSubType, action class name, [arguments])
+	- (ACTION_END, PowSubType, action class name)
+	The PowSubType of actions which have none is None.
+	- (TAG_CHANGE, entity id, tag, value)
+	Tags and enums are left as plain integers, and entities are EntityRefs.
+	The file is memory-mapped and only decoded as far as it is iterated.
+	"""
+	with open(path, "rb") as f:
+		if not f.seek(0, 2):
+			raise ValueError("Not an event log")
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		for event in _read_records(data):
+			yield event
+	finally:
+		data.close()
@@ -1,14 +1,18 @@
-import logging
-import random
+import copy
 import time
 from calendar import timegm
 from itertools import chain
-from .actions import Attack, BeginTurn, Death, Deaths, EndTurn, EventListener
+from . import snapshot
+from .actions import Attack, BeginTurn, Death, Deaths, EndTurn, EventListener, EventListenerIndex
 from .card import Card, THE_COIN
-from .entity import Entity
+from .entity import Entity, cached_view, invalidate_caches
 from .enums import CardType, PlayState, Step, Zone
+from .logging import get_logger
 from .managers import GameManager
-from .utils import CardList
+from .utils import CardList, IdentityDict, Journal, RandomStream
+
+
+log = get_logger(__name__)
 
 
 class GameOver(Exception):
@@ -19,10 +23,16 @@ class BaseGame(Entity):
 	type = CardType.GAME
 	MAX_MINIONS_ON_FIELD = 7
 	Manager = GameManager
+	# Bumped on every change to the game's entities, see invalidate_caches()
+	_state_version = 0
+	# Changes since the oldest checkpoint, see checkpoint()
+	_journal = None
 
-	def __init__(self, players):
+	def __init__(self, players, seed=None):
 		self.data = None
 		super().__init__()
+		# Every random draw of the game and its card scripts goes through it
+		self.random = RandomStream(seed)
 		self.players = players
 		for player in players:
 			player.game = self
@@ -30,50 +40,189 @@ class BaseGame(Entity):
 		self.next_step = None
 		self.turn = 0
 		self.current_player = None
-		self.auras = []
+		self.auras = CardList()
+		self.event_listeners = EventListenerIndex(self)
 		self.minions_killed = CardList()
 		self.minions_killed_this_turn = CardList()
+		self._death_candidates = IdentityDict()
 
 	def __repr__(self):
 		return "<%s %s>" % (self.__class__.__name__, self)
 
 	def __str__(self):
-		return "%s vs %s" % (self.players)
+		return "%s vs %s" % tuple(self.players)
 
 	def __iter__(self):
 		return self.all_entities.__iter__()
 
 	@property
+	def game(self):
+		return self
+
+	@cached_view
 	def board(self):
-		return CardList(chain(self.players[0].field, self.players[1].field))
+		return chain(self.players[0].field, self.players[1].field)
 
-	@property
+	@cached_view
 	def decks(self):
-		return CardList(chain(self.players[0].deck, self.players[1].deck))
+		return chain(self.players[0].deck, self.players[1].deck)
 
-	@property
+	@cached_view
 	def hands(self):
-		return CardList(chain(self.players[0].hand, self.players[1].hand))
+		return chain(self.players[0].hand, self.players[1].hand)
 
-	@property
+	@cached_view
 	def characters(self):
-		return CardList(chain(self.players[0].characters, self.players[1].characters))
+		return chain(self.players[0].characters, self.players[1].characters)
 
-	@property
+	@cached_view
 	def all_entities(self):
-		return CardList(chain(self.entities, self.hands, self.decks))
+		return chain(self.entities, self.hands, self.decks)
 
-	@property
+	@cached_view
 	def entities(self):
-		return CardList(chain([self], self.players[0].entities, self.players[1].entities))
+		return chain([self], self.players[0].entities, self.players[1].entities)
 
-	@property
+	@cached_view
 	def live_entities(self):
-		return CardList(chain(self.players[0].live_entities, self.players[1].live_entities))
+		return chain(self.players[0].live_entities, self.players[1].live_entities)
 
 	def filter(self, *args, **kwargs):
 		return self.all_entities.filter(*args, **kwargs)
 
+	def clone(self):
+		"""
+		Returns a copy of the game which can be played independently, for
+		example to look ahead at the outcome of a move.
+		This is a copy.deepcopy() of the game: its copy hooks share the
+		immutable card data with the original game and give the copied
+		entities new uuids, but everything else is copied generically.
+		To look ahead at a move in place, see checkpoint() instead.
+		Must not be called while actions are being resolved.
+		"""
+		return copy.deepcopy(self)
+
+	def snapshot(self):
+		"""
+		Returns the full state of the game as compact bytes, which can be
+		sent to another process and turned back into a game with
+		from_snapshot(). Observers are not part of the snapshot.
+		Must not be called while actions are being resolved.
+		"""
+		return snapshot.dumps(self)
+
+	@classmethod
+	def from_snapshot(cls, data):
+		"""
+		Returns a new game from the snapshot \a data (see snapshot()).
+		"""
+		game = snapshot.loads(data)
+		if not isinstance(game, cls):
+			raise TypeError("Not a %s snapshot: %r" % (cls.__name__, game))
+		return game
+
+	def checkpoint(self):
+		"""
+		Returns a checkpoint which the game can be reverted to in place
+		with rollback(), for example to look ahead at the outcome of a move
+		without cloning the game. Checkpoints can be nested.
+		The changes made to the game are journaled until discard_checkpoints()
+		is called. Other games, including clones, are not affected.
+		Rolling back also restores the random number generator and the
+		entity counters, so making the same moves again gives the same game.
+		Must not be called while actions are being resolved.
+		"""
+		journal = self._journal
+		if journal is None:
+			# Written directly: the journal is not part of the game's state
+			journal = self.__dict__["_journal"] = Journal()
+		state = self.random.getstate(), self.manager.counter, self.manager.order_of_play
+		return journal.checkpoint(self, state)
+
+	def rollback(self, checkpoint):
+		"""
+		Reverts the game to \a checkpoint. The checkpoint stays valid, and
+		later checkpoints are discarded.
+		"""
+		journal = self._journal
+		assert journal is not None, "No checkpoint on %r" % (self)
+		journal.rollback(checkpoint)
+		invalidate_caches(self)
+		self.invalidate_auras()
+
+	def _undo(self, name, value):
+		if name is None:
+			# Rolled back to a checkpoint (see checkpoint())
+			random_state, self.manager.counter, self.manager.order_of_play = value
+			self.random.setstate(random_state)
+			return
+		super()._undo(name, value)
+
+	def discard_checkpoints(self):
+		"""
+		Stops journaling changes. Checkpoints can no longer be rolled back to.
+		"""
+		self.__dict__.pop("_journal", None)
+
+	def listening_entities(self, cls, at):
+		"""
+		Returns the entities listening to \a cls actions at \a at, in the
+		order of chain(self.hands, self.entities).
+		"""
+		ret = []
+		for entity in self.event_listeners.get(cls, at):
+			position = self._broadcast_position(entity)
+			if position is not None:
+				ret.append((position, entity))
+		ret.sort(key=lambda x: x[0])
+		return [entity for position, entity in ret]
+
+	def _broadcast_position(self, entity):
+		"""
+		Returns a sort key for the position of \a entity in
+		chain(self.hands, self.entities), or None if it is in neither.
+		"""
+		if entity is self:
+			return (1, )
+		controller = entity.controller
+		player = self.players.index(controller)
+		if entity is controller:
+			return (2, player, 3)
+
+		if entity.zone == Zone.HAND:
+			if entity in controller.hand:
+				return (0, player, controller.hand.index(entity))
+		elif entity.zone == Zone.SECRET:
+			# Secrets are only active on the opponent's turn
+			if not controller.current_player and entity in controller.secrets:
+				return (2, player, 2, controller.secrets.index(entity), 0)
+		elif entity.zone == Zone.PLAY:
+			hero = controller.hero
+			if entity.type == CardType.MINION:
+				if entity in controller.field:
+					return (2, player, 1, controller.field.index(entity), 0)
+			elif entity.type == CardType.HERO:
+				if entity is hero:
+					return (2, player, 0, 0)
+			elif entity.type == CardType.HERO_POWER:
+				if hero and entity is hero.power:
+					return (2, player, 0, 1)
+			elif entity.type == CardType.WEAPON:
+				if hero and entity is controller.weapon:
+					return (2, player, 0, 2)
+			elif entity.type == CardType.ENCHANTMENT:
+				# Only the buffs of minions, heroes and secrets are listening
+				owner = entity.owner
+				if owner.type not in (CardType.MINION, CardType.HERO, CardType.SPELL):
+					return None
+				position = self._broadcast_position(owner)
+				if position is None or position[0] != 2 or entity not in owner.buffs:
+					return None
+				if owner.type == CardType.HERO:
+					return position[:3] + (3 + owner.buffs.index(entity), )
+				return position[:4] + (1 + owner.buffs.index(entity), )
+		return None
+
 	def attack(self, source, target):
 		return self.queue_actions(source, [Attack(source, target)])
 
@@ -81,13 +230,14 @@ class BaseGame(Entity):
 		"""
 		See https://github.com/jleclanche/fireplace/wiki/Combat
 		for information on how attacking works
+		Frame, see run().
 		"""
 		attacker = self.proposed_attacker
 		defender = self.proposed_defender
 		self.proposed_attacker = None
 		self.proposed_defender = None
 		if attacker.should_exit_combat:
-			logging.info("Attack has been interrupted.")
+			log.info("Attack has been interrupted.")
 			attacker.should_exit_combat = False
 			attacker.attacking = False
 			defender.defending = False
@@ -95,9 +245,9 @@ class BaseGame(Entity):
 		# Save the attacker/defender atk values in case they change during the attack
 		# (eg. in case of Enrage)
 		def_atk = defender.atk
-		attacker.hit(defender, attacker.atk)
+		yield attacker.resolve_hit(defender, attacker.atk)
 		if def_atk:
-			defender.hit(attacker, def_atk)
+			yield defender.resolve_hit(attacker, def_atk)
 		attacker.attacking = False
 		defender.defending = False
 		attacker.num_attacks += 1
@@ -107,7 +257,7 @@ class BaseGame(Entity):
 		Plays \a card from a Player's hand
 		"""
 		player = card.controller
-		logging.info("%s plays %r", player, card)
+		log.info("%s plays %r", player, card)
 		cost = card.cost
 		if player.temp_mana:
 			# The coin, Innervate etc
@@ -115,7 +265,7 @@ class BaseGame(Entity):
 			player.temp_mana = max(0, player.temp_mana - card.cost)
 		player.used_mana += cost
 		if card.overload:
-			logging.info("%s overloads for %i mana", player, card.overload)
+			log.info("%s overloads for %i mana", player, card.overload)
 			player.overloaded += card.overload
 		player.last_card_played = card
 		player.summon(card)
@@ -145,16 +295,36 @@ class BaseGame(Entity):
 		if gameover:
 			raise GameOver("The game has ended.")
 
+	def mark_death_candidate(self, entity):
+		"""
+		Mark \a entity to be checked on the next death sweep.
+		This must be called whenever something may have made it lethal.
+		"""
+		self._death_candidates[entity] = True
+
 	def process_deaths(self):
+		return self.run(self.resolve_deaths())
+
+	def resolve_deaths(self):
+		"""
+		Frame (see run()) of the death sweep.
+		"""
+		if not self._death_candidates:
+			return
+		candidates = self._death_candidates
+		self._death_candidates = IdentityDict()
+
 		actions = []
+		# Deaths are scheduled in the order of live_entities
 		for card in self.live_entities:
+			if card not in candidates:
+				continue
 			if card.to_be_destroyed and not card.ignore_events:
 				actions += self._schedule_death(card)
 
-		self.check_for_end_game()
-
 		if actions:
-			self.queue_actions(self, actions)
+			self.check_for_end_game()
+			yield self.resolve_actions(self, actions)
 
 	def _schedule_death(self, card):
 		"""
@@ -162,8 +332,8 @@ class BaseGame(Entity):
 		trigger attached to the Game object.
 		Returns a list of actions to perform during the death sweep.
 		"""
-		logging.debug("Scheduling death for %r", card)
-		target.zone = Zone.GRAVEYARD
+		log.debug("Scheduling death for %r", card)
+		card.zone = Zone.GRAVEYARD
 		card.ignore_events = True
 		if card.type == CardType.MINION:
 			self.minions_killed.append(card)
@@ -177,18 +347,51 @@ class BaseGame(Entity):
 	def queue_actions(self, source, actions):
 		"""
 		Queue a list of \a actions for processing from \a source.
+		Returns the list of their results.
+		"""
+		return self.run(self.resolve_actions(source, actions))
+
+	def resolve_actions(self, source, actions):
+		"""
+		Frame (see run()) resolving \a actions from \a source, in order.
 		"""
 		ret = []
 		for action in actions:
 			if isinstance(action, EventListener):
-				logging.debug("Registering %r on %r", action, self)
-				source.controller._events.append(action)
+				log.debug("Registering %r on %r", action, self)
+				controller = source.controller
+				controller._events.append(action)
+				if action.zone == controller.zone:
+					self.event_listeners.add(controller, action)
 			else:
-				ret.append(action.trigger(source, self))
+				ret.append((yield action.resolve(source, self)))
 				self.refresh_auras() #TODO: Auras should refresh at the Phase level.
 
 		return ret
 
+	def run(self, frame):
+		"""
+		Run the resolution \a frame to completion and return its result.
+		A frame is a generator which, instead of calling the frames it
+		depends on (the actions it triggers, their listeners, the death
+		sweep...), yields them and is sent back their result. They are
+		resolved here, depth first, on an explicit stack rather than the
+		Python one, so long chains of actions do not nest Python calls.
+		"""
+		stack = [frame]
+		value = None
+		while True:
+			try:
+				subframe = stack[-1].send(value)
+			except StopIteration as e:
+				stack.pop()
+				if not stack:
+					return e.value
+				value = e.value
+			else:
+				stack.append(subframe)
+				value = None
+
 	def pick_first_player(self):
 		"""
 		Picks and returns first player, second player
@@ -197,9 +400,19 @@ class BaseGame(Entity):
 		"""
 		return self.players[0], self.players[1]
 
+	def invalidate_auras(self, zone=None):
+		"""
+		Flag the auras affecting entities in \a zone for re-evaluation on the
+		next refresh. If \a zone is None, every aura is flagged.
+		"""
+		for aura in self.auras:
+			if zone is None or aura.zone == zone:
+				aura.dirty = True
+
 	def refresh_auras(self):
 		for aura in self.auras:
-			aura.update()
+			if aura.dirty or aura.dynamic:
+				aura.update()
 
 	def prepare(self):
 		self.players[0].opponent = self.players[1]
@@ -209,6 +422,7 @@ class BaseGame(Entity):
 			player.zone = Zone.PLAY
 			player.summon(player.original_deck.hero)
 			for card in player.original_deck:
+				self.manager.new_entity(card)
 				card.controller = player
 				card.zone = Zone.DECK
 			player.shuffle_deck()
@@ -225,7 +439,7 @@ class BaseGame(Entity):
 		self.current_player = self.player1
 
 	def start(self):
-		logging.info("Starting game: %r" % (self))
+		log.info("Starting game: %r", self)
 		self.prepare()
 		self.begin_turn(self.player1)
 
@@ -233,7 +447,7 @@ class BaseGame(Entity):
 		return self.queue_actions(self, [EndTurn(self.current_player)])
 
 	def _end_turn(self):
-		logging.info("%s ends turn %i", self.current_player, self.turn)
+		log.info("%s ends turn %i", self.current_player, self.turn)
 		self.step, self.next_step = self.next_step, Step.MAIN_CLEANUP
 
 		self.current_player.temp_mana = 0
@@ -241,7 +455,7 @@ class BaseGame(Entity):
 			if not character.num_attacks:
 				character.frozen = False
 		for buff in self.current_player.entities.filter(one_turn_effect=True):
-			logging.info("Ending One-Turn effect: %r", buff)
+			log.info("Ending One-Turn effect: %r", buff)
 			buff.destroy()
 
 		self.step, self.next_step = self.next_step, Step.MAIN_NEXT
@@ -254,7 +468,7 @@ class BaseGame(Entity):
 		self.step, self.next_step = self.next_step, Step.MAIN_START_TRIGGERS
 		self.step, self.next_step = self.next_step, Step.MAIN_START
 		self.turn += 1
-		logging.info("%s begins turn %i", player, self.turn)
+		log.info("%s begins turn %i", player, self.turn)
 		self.step, self.next_step = self.next_step, Step.MAIN_ACTION
 		self.current_player = player
 		self.minions_killed_this_turn = CardList()
@@ -288,13 +502,13 @@ class CoinRules:
 	The second player gets "The Coin" (GAME_005).
 	"""
 	def pick_first_player(self):
-		winner = random.choice(self.players)
-		logging.info("Tossing the coin... %s wins!", winner)
+		winner = self.random.choice(self.players)
+		log.info("Tossing the coin... %s wins!", winner)
 		return winner, winner.opponent
 
 	def start(self):
 		super().start()
-		logging.info("%s gets The Coin (%s)", self.player2, THE_COIN)
+		log.info("%s gets The Coin (%s)", self.player2, THE_COIN)
 		self.player2.give(THE_COIN)
 
 
@@ -309,7 +523,7 @@ class MulliganRules:
 		self.begin_mulligan()
 
 	def begin_mulligan(self):
-		logging.info("Entering mulligan phase")
+		log.info("Entering mulligan phase")
 		self.step, self.next_step = self.next_step, Step.MAIN_READY
 
 
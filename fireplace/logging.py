@@ -0,0 +1,66 @@
+"""
+Logging of the engine, in the "fireplace" logger hierarchy.
+
+Messages are only formatted when they are actually logged, so log calls
+pass their arguments to the logger instead of formatting them.
+For headless simulations, set_enabled(False) (or FIREPLACE_LOGGING=0 in
+the environment) turns the engine's log calls into no-ops, which do not
+even check the log level.
+"""
+import logging
+import os
+
+
+LEVELS = ("debug", "info", "warning", "error")
+
+_enabled = os.environ.get("FIREPLACE_LOGGING", "1") != "0"
+_loggers = {}
+
+
+def _noop(*args, **kwargs):
+	pass
+
+
+class Logger(object):
+	"""
+	Wraps a logging.Logger, whose log methods are swapped for no-ops
+	while logging is disabled.
+	"""
+	def __init__(self, name):
+		self.logger = logging.getLogger(name)
+		self._bind()
+
+	def __repr__(self):
+		return "<%s %r>" % (self.__class__.__name__, self.logger.name)
+
+	def _bind(self):
+		for level in LEVELS:
+			setattr(self, level, getattr(self.logger, level) if _enabled else _noop)
+
+
+def get_logger(name):
+	"""
+	Returns the Logger called \a name, which should be in the "fireplace"
+	hierarchy (eg. the name of the calling module).
+	"""
+	logger = _loggers.get(name)
+	if logger is None:
+		logger = _loggers[name] = Logger(name)
+	return logger
+
+
+def is_enabled():
+	return _enabled
+
+
+def set_enabled(enabled):
+	"""
+	Enable or disable every log call of the engine.
+	"""
+	global _enabled
+	_enabled = enabled
+	for logger in _loggers.values():
+		logger._bind()
+
+
+log = get_logger("fireplace")
@@ -1,11 +1,35 @@
+from collections import OrderedDict
+from copy import deepcopy
 from .enums import GameTag
 
 
 class Manager(object):
+	# Set on the manager of a game once it has an observer of tag changes: from
+	# then on, writes to the attributes in the managers' maps of the game's
+	# entities are reported to its observers. Other games are not affected.
+	track_tags = False
+
 	def __init__(self, obj):
 		self.obj = obj
 		self.observers = []
 
+	def __deepcopy__(self, memo):
+		# Observers watch a specific game, they are not copied along
+		cls = self.__class__
+		ret = cls.__new__(cls)
+		memo[id(self)] = ret
+		ret.__dict__.update(self.__dict__)
+		ret.obj = deepcopy(self.obj, memo)
+		ret.observers = []
+		ret.__dict__.pop("track_tags", None)
+		return ret
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["observers"] = []
+		state.pop("track_tags", None)
+		return state
+
 	def __getitem__(self, tag):
 		if self.map.get(tag):
 			return getattr(self.obj, self.map[tag], 0)
@@ -27,8 +51,21 @@ class Manager(object):
 			if v is not None:
 				yield k, self[k]
 
+	@classmethod
+	def attribute_tags(cls):
+		"""
+		Returns the reverse of the map, {attribute: tag}.
+		"""
+		ret = cls.__dict__.get("_attribute_tags")
+		if ret is None:
+			ret = {attr: tag for tag, attr in cls.map.items() if attr}
+			cls._attribute_tags = ret
+		return ret
+
 	def register(self, observer):
 		self.observers.append(observer)
+		if type(observer).tag_change is not Observer.tag_change:
+			self.track_tags = True
 
 	def update(self, tags):
 		for k, v in tags.items():
@@ -50,20 +87,100 @@ class GameManager(Manager):
 		super().__init__(*args)
 		self.id = 1
 		self.counter = self.id + 1
+		self.order_of_play = 0
 
-	def action(self, type, *args):
+	def action(self, action, *args):
 		for observer in self.observers:
-			observer.action(type, args)
+			observer.action(action, args)
 
-	def action_end(self, type, *args):
+	def action_end(self, action, *args):
 		for observer in self.observers:
-			observer.action_end(type, args)
+			observer.action_end(action, args)
 
 	def new_entity(self, entity):
-		for observer in self.observers:
-			observer.new_entity(entity)
 		entity.manager.id = self.counter
 		self.counter += 1
+		for observer in self.observers:
+			observer.new_entity(entity)
+
+	def tag_change(self, entity, tag, value):
+		for observer in self.observers:
+			observer.tag_change(entity, tag, value)
+
+	def hero_power(self, power, target):
+		for observer in self.observers:
+			observer.hero_power(power, target)
+
+	def new_order_of_play(self):
+		"""
+		Returns the next position in the order in which cards were played
+		(or summoned) in the game.
+		"""
+		self.order_of_play += 1
+		return self.order_of_play
+
+
+class Observer(object):
+	"""
+	Base class for the observers of a game (see GameManager.register()).
+	"""
+	def action(self, action, args):
+		pass
+
+	def action_end(self, action, args):
+		pass
+
+	def new_entity(self, entity):
+		pass
+
+	def tag_change(self, entity, tag, value):
+		"""
+		Called when \a tag of \a entity is set to a new \a value.
+		Only observers which override it make the game report tag changes.
+		"""
+		pass
+
+	def hero_power(self, power, target):
+		"""
+		Called when the hero power \a power is used on \a target (or None),
+		before its actions are resolved.
+		"""
+		pass
+
+
+class DeltaObserver(Observer):
+	"""
+	Collects the tag changes of a game as (entity id, tag, value) triples,
+	like the TAG_CHANGE packets of the Hearthstone power log, and passes
+	them to \a callback at the end of each outermost action. Only the last
+	value of a tag is passed. Entity values are replaced by their id.
+	Changes made outside of an action are passed along with the next batch,
+	or on flush().
+	"""
+	def __init__(self, callback):
+		self.callback = callback
+		self.depth = 0
+		self.changes = OrderedDict()
+
+	def action(self, action, args):
+		self.depth += 1
+
+	def action_end(self, action, args):
+		self.depth -= 1
+		if not self.depth:
+			self.flush()
+
+	def tag_change(self, entity, tag, value):
+		manager = getattr(value, "manager", None)
+		if manager is not None:
+			value = manager.id
+		self.changes[entity.manager.id, tag] = value
+
+	def flush(self):
+		if self.changes:
+			changes = [(id, tag, value) for (id, tag), value in self.changes.items()]
+			self.changes.clear()
+			self.callback(changes)
 
 
 class PlayerManager(Manager):
@@ -1,14 +1,16 @@
-import logging
-import random
 from itertools import chain
 from .actions import Draw, Give, Summon
 from .deck import Deck
-from .entity import Entity
+from .entity import Entity, cached_view
 from .enums import CardType, PlayState, Zone
 from .entity import slot_property
+from .logging import get_logger
 from .managers import PlayerManager
 from .targeting import *
-from .utils import CardList
+from .utils import CardList, ZoneList
+
+
+log = get_logger(__name__)
 
 
 class Player(Entity):
@@ -19,16 +21,18 @@ class Player(Entity):
 	outgoing_healing_adjustment = slot_property("outgoing_healing_adjustment")
 	spellpower_double = slot_property("spellpower_double", sum)
 	type = CardType.PLAYER
+	# Set by the game the player joins
+	game = None
 
 	def __init__(self, name):
 		self.data = None
 		super().__init__()
 		self.name = name
 		self.deck = Deck()
-		self.hand = CardList()
-		self.field = CardList()
-		self.secrets = CardList()
-		self.buffs = []
+		self.hand = ZoneList()
+		self.field = ZoneList()
+		self.secrets = ZoneList()
+		self.buffs = CardList()
 		self.max_hand_size = 10
 		self.max_resources = 10
 		self.current_player = False
@@ -68,11 +72,11 @@ class Player(Entity):
 	def spellpower(self):
 		return sum(minion.spellpower for minion in self.field)
 
-	@property
+	@cached_view
 	def characters(self):
-		return CardList(chain([self.hero] if self.hero else [], self.field))
+		return chain([self.hero] if self.hero else [], self.field)
 
-	@property
+	@cached_view
 	def entities(self):
 		ret = []
 		for entity in self.field:
@@ -81,9 +85,9 @@ class Player(Entity):
 		if not self.current_player:
 			for entity in self.secrets:
 				ret += entity.entities
-		return CardList(chain(list(self.hero.entities) if self.hero else [], ret, [self]))
+		return chain(list(self.hero.entities) if self.hero else [], ret, [self])
 
-	@property
+	@cached_view
 	def live_entities(self):
 		ret = self.field[:]
 		if self.hero:
@@ -110,7 +114,7 @@ class Player(Entity):
 		self.original_deck.hero = hero
 
 	def discard_hand(self):
-		logging.info("%r discards his entire hand!" % (self))
+		log.info("%r discards his entire hand!", self)
 		# iterate the list in reverse so we don't skip over cards in the process
 		# yes it's stupid.
 		for card in self.hand[::-1]:
@@ -128,7 +132,7 @@ class Player(Entity):
 				return
 			else:
 				card = self.deck[-1]
-			logging.info("%s mills %r" % (self, card))
+			log.info("%s mills %r", self, card)
 			card.destroy()
 			return card
 		else:
@@ -140,7 +144,7 @@ class Player(Entity):
 
 	def fatigue(self):
 		self.fatigue_counter += 1
-		logging.info("%s takes %i fatigue damage" % (self, self.fatigue_counter))
+		log.info("%s takes %i fatigue damage", self, self.fatigue_counter)
 		self.hero.hit(self.hero, self.fatigue_counter)
 
 	@property
@@ -150,18 +154,18 @@ class Player(Entity):
 	@max_mana.setter
 	def max_mana(self, amount):
 		self._max_mana = min(self.max_resources, max(0, amount))
-		logging.info("%s is now at %i mana crystals", self, self._max_mana)
+		log.info("%s is now at %i mana crystals", self, self._max_mana)
 
 	def take_control(self, card):
-		logging.info("%s takes control of %r", self, card)
+		log.info("%s takes control of %r", self, card)
 		zone = card.zone
 		card.zone = Zone.SETASIDE
 		card.controller = self
 		card.zone = zone
 
 	def shuffle_deck(self):
-		logging.info("%r shuffles their deck", self)
-		random.shuffle(self.deck)
+		log.info("%r shuffles their deck", self)
+		self.game.random.shuffle(self.deck)
 
 	def summon(self, card):
 		"""
@@ -0,0 +1,210 @@
+"""
+Replays: the smallest record a game can be played again from.
+
+Games are deterministic for a given seed, decks and sequence of player
+decisions, so a Recorder only stores those, along with a hash of the final
+state of the game. replay() plays the decisions again, without any agent,
+and checks that it ends up in the same state. Any detail of the game (eg.
+its event log) can be recovered by observing the replayed game.
+Usage: python -m fireplace.replay FILE...
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import sys
+import time
+import zlib
+from .actions import Attack, EndTurn, Play
+from .entity import Entity
+from .enums import GameTag
+from .game import GameOver
+from .logging import set_enabled
+from .managers import Observer
+from .player import Player
+
+
+MAGIC = b"FPRP\x01"
+
+# Decisions
+PLAY = 0  # (PLAY, card id, target id or 0, choose card ID or None)
+ATTACK = 1  # (ATTACK, attacker id, defender id)
+HERO_POWER = 2  # (HERO_POWER, hero power id, target id or 0)
+END_TURN = 3  # (END_TURN, )
+
+# Tags which are not part of the state hash: the wall clock time of the turn
+UNHASHED_TAGS = frozenset((GameTag.TURN_START, ))
+
+
+class ReplayError(Exception):
+	pass
+
+
+def _id(entity):
+	return entity.manager.id if entity is not None else 0
+
+
+def _value(value):
+	if isinstance(value, Entity):
+		return _id(value)
+	elif isinstance(value, int):
+		return int(value)
+	elif isinstance(value, list):
+		return [_value(item) for item in value]
+	return value
+
+
+def state_hash(game):
+	"""
+	Returns a hash of the state of \a game: the tags of its entities, in
+	the order of game.all_entities, and the state of its RNG.
+	"""
+	h = hashlib.sha1()
+	for entity in game.all_entities:
+		tags = sorted(
+			(int(tag), _value(value)) for tag, value in entity.tags.items()
+			if tag not in UNHASHED_TAGS
+		)
+		h.update(repr((_id(entity), tags)).encode("utf-8"))
+	h.update(repr(game.random.getstate()).encode("utf-8"))
+	return h.hexdigest()
+
+
+class Recorder(Observer):
+	"""
+	Records the decisions of the players of \a game, from the moment it is
+	created, for dumps(). The game must not have taken any decision yet.
+	Usage: recorder = Recorder(game) ... data = recorder.dumps()
+	"""
+	def __init__(self, game):
+		self.game = game
+		self.depth = 0
+		self.decisions = []
+		game.manager.register(self)
+
+	def action(self, action, args):
+		# Only the outermost actions are decisions, nested ones are effects
+		if not self.depth:
+			if isinstance(action, Play):
+				self.decisions.append((PLAY, _id(action.card), _id(action.target), action.choose))
+			elif isinstance(action, Attack):
+				self.decisions.append((ATTACK, _id(action.source), _id(action.target)))
+			elif isinstance(action, EndTurn):
+				self.decisions.append((END_TURN, ))
+		self.depth += 1
+
+	def action_end(self, action, args):
+		self.depth -= 1
+
+	def hero_power(self, power, target):
+		if not self.depth:
+			self.decisions.append((HERO_POWER, _id(power), _id(target)))
+
+	def dumps(self):
+		"""
+		Returns the replay of the game so far, as compact bytes.
+		"""
+		game = self.game
+		cls = type(game)
+		record = {
+			"game": "%s:%s" % (cls.__module__, cls.__name__),
+			"seed": game.random.seed_value,
+			"players": [[
+				player.name, player.original_deck.hero, [card.id for card in player.original_deck],
+			] for player in game.players],
+			"decisions": self.decisions,
+			"hash": state_hash(game),
+		}
+		data = json.dumps(record, separators=(",", ":")).encode("utf-8")
+		return MAGIC + zlib.compress(data, 9)
+
+
+def loads(data):
+	"""
+	Returns the replay \a data (see Recorder.dumps()) as a dict.
+	"""
+	if data[:len(MAGIC)] != MAGIC:
+		raise ValueError("Not a replay")
+	return json.loads(zlib.decompress(data[len(MAGIC):]).decode("utf-8"))
+
+
+def _decide(game, decision, entities):
+	type = decision[0]
+	if type == END_TURN:
+		game.end_turn()
+	elif type == PLAY:
+		card, target, choose = decision[1:]
+		entities[card].play(target=entities.get(target), choose=choose)
+	elif type == ATTACK:
+		entities[decision[1]].attack(entities[decision[2]])
+	elif type == HERO_POWER:
+		entities[decision[1]].use(target=entities.get(decision[2]))
+	else:
+		raise ValueError("Invalid decision: %r" % (decision, ))
+
+
+def replay(data, observers=(), verify=True):
+	"""
+	Plays the replay \a data again and returns the game. The \a observers
+	are registered on the game before it starts.
+	Raises ReplayError if the replay cannot be played, or if \a verify is
+	True and the game does not end up in the recorded state.
+	"""
+	record = loads(data)
+	module, sep, class_name = record["game"].partition(":")
+	cls = getattr(importlib.import_module(module), class_name)
+	players = []
+	for name, hero, deck in record["players"]:
+		player = Player(name=name)
+		player.prepare_deck(deck, hero)
+		players.append(player)
+	game = cls(players=tuple(players), seed=record["seed"])
+	for observer in observers:
+		game.manager.register(observer)
+
+	game.start()
+	decisions = record["decisions"]
+	for i, decision in enumerate(decisions):
+		entities = {_id(entity): entity for entity in game.all_entities}
+		try:
+			_decide(game, decision, entities)
+		except GameOver:
+			if i != len(decisions) - 1:
+				raise ReplayError("The game ended at decision %i of %i" % (i + 1, len(decisions)))
+		except (KeyError, AssertionError) as e:
+			raise ReplayError("Decision %i (%r) cannot be replayed: %r" % (i + 1, decision, e))
+
+	if verify:
+		digest = state_hash(game)
+		if digest != record["hash"]:
+			raise ReplayError("Final state %s does not match the recorded %s" % (digest, record["hash"]))
+	return game
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay and verify recorded games.")
+	parser.add_argument("files", nargs="+", metavar="FILE", help="replay files")
+	args = parser.parse_args()
+
+	set_enabled(False)
+	failures = 0
+	t = time.perf_counter()
+	for path in args.files:
+		with open(path, "rb") as f:
+			data = f.read()
+		try:
+			replay(data)
+		except ReplayError as e:
+			failures += 1
+			sys.stderr.write("%s: %s\n" % (path, e))
+	elapsed = time.perf_counter() - t
+
+	count = len(args.files)
+	sys.stderr.write("%i games replayed in %.2fs (%.1f games/s), %i failed\n" % (
+		count, elapsed, count / elapsed, failures
+	))
+	sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+	main()
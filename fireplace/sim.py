@@ -0,0 +1,258 @@
+"""
+Batch game simulations.
+
+Plays games in a pool of worker processes, streaming the result of each
+game as JSON on stdout as soon as it finishes, and a summary on stderr.
+Usage: python -m fireplace.sim [-n GAMES] [-j PROCESSES] [--seed SEED] ...
+See --help for every option.
+"""
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from .enums import PlayState
+from .game import Game, GameOver
+from .logging import set_enabled
+from .player import Player
+from .utils import RandomStream, fork_seed, random_drafts
+
+
+# Games still running after this many turns are stopped as draws
+MAX_TURNS = 100
+
+
+def random_agent(game, player, rng):
+	"""
+	Uses the hero power, plays every playable card in hand and attacks
+	with every character which can attack, choosing targets at random.
+	"""
+	power = player.hero.power
+	if power.is_usable():
+		if power.has_target():
+			power.use(target=rng.choice(power.targets))
+		else:
+			power.use()
+
+	for card in player.hand[:]:
+		# Playing a card can discard or draw others
+		if card not in player.hand or not card.is_playable():
+			continue
+		if card.has_target():
+			card.play(target=rng.choice(card.targets))
+		else:
+			card.play()
+
+	for character in list(player.characters):
+		if character.can_attack():
+			targets = character.targets
+			if targets:
+				character.attack(rng.choice(targets))
+
+
+def passive_agent(game, player, rng):
+	"""
+	Never does anything but end its turns.
+	"""
+	pass
+
+
+AGENTS = {
+	"passive": passive_agent,
+	"random": random_agent,
+}
+
+
+def get_agent(name):
+	"""
+	Returns the agent called \a name in AGENTS, or the function referred
+	to by \a name as "module:function".
+	An agent is called as agent(game, player, rng) to play a turn of
+	\a player, except for ending it. \a rng is the agent's RandomStream.
+	"""
+	if name in AGENTS:
+		return AGENTS[name]
+	module, sep, func = name.partition(":")
+	if not sep:
+		raise ValueError("Unknown agent: %r" % (name))
+	return getattr(importlib.import_module(module), func)
+
+
+def get_hero(name):
+	"""
+	Returns the card ID of the hero \a name, which is either a card ID or
+	a class name from fireplace.cards.heroes (eg. MAGE).
+	"""
+	from .cards import heroes
+	return getattr(heroes, name.upper(), name)
+
+
+def get_game_class(brawl=None):
+	"""
+	Returns the game class of the brawl \a brawl from fireplace.brawls,
+	or the standard Game class if \a brawl is None.
+	"""
+	if brawl is None:
+		return Game
+	from . import brawls
+	return getattr(brawls, brawl)
+
+
+def play_game(seed, hero1="MAGE", hero2="WARRIOR", deck1=None, deck2=None,
+		agent1="random", agent2="random", brawl=None, max_turns=MAX_TURNS):
+	"""
+	Plays a game with \a agent1 and \a agent2 until it ends or \a max_turns
+	turns are played, and returns its result as a dict. The winner is None
+	if the game is a draw or was stopped.
+	Missing decks are drafted at random. The whole game, including the
+	decks and the agents' choices, is reproducible from \a seed.
+	"""
+	t = time.perf_counter()
+	heroes = (get_hero(hero1), get_hero(hero2))
+	decks = (deck1, deck2)
+	players = []
+	for i, hero in enumerate(heroes):
+		name = "Player%i" % (i + 1)
+		deck = decks[i]
+		if deck is None:
+			deck = random_drafts(hero, 1, seed=fork_seed(seed, "deck%i" % (i + 1)))[0]
+		player = Player(name=name)
+		player.prepare_deck(deck, hero)
+		players.append(player)
+
+	game_class = get_game_class(brawl)
+	if hasattr(game_class, "new_game"):
+		# The brawl picks the decks
+		game = game_class.new_game(*players, seed=seed)
+	else:
+		game = game_class(players=tuple(players), seed=seed)
+
+	agents = {}
+	for i, (player, agent) in enumerate(zip(players, (agent1, agent2))):
+		agents[player] = get_agent(agent), RandomStream(fork_seed(seed, "agent%i" % (i + 1)))
+
+	winner = None
+	try:
+		game.start()
+		while game.turn <= max_turns:
+			player = game.current_player
+			agent, rng = agents[player]
+			agent(game, player, rng)
+			game.end_turn()
+	except GameOver:
+		# Players are also marked as WON when nobody lost, check the losers
+		for player in players:
+			if player.playstate != PlayState.LOST and player.opponent.playstate == PlayState.LOST:
+				winner = player.name
+
+	return {
+		"seed": seed,
+		"winner": winner,
+		"turns": game.turn,
+		"time": time.perf_counter() - t,
+	}
+
+
+# Game settings of the worker processes, see _init_worker()
+_config = None
+
+
+def _init_worker(config, log=True):
+	global _config
+	_config = config
+	if not log:
+		set_enabled(False)
+	# Load the card database once per worker, before the first game
+	from . import cards
+
+
+def _play(args):
+	index, seed = args
+	ret = play_game(seed, **_config)
+	ret["game"] = index
+	return ret
+
+
+def simulate(count, seed=None, processes=None, log=False, **config):
+	"""
+	Plays \a count games in a pool of \a processes worker processes (one
+	per CPU by default), and yields the result of each game (see
+	play_game()) as soon as it ends, in no particular order.
+	Game i is seeded with fork_seed(seed, i). The keyword arguments are
+	passed on to play_game().
+	The workers do not log anything unless \a log is True. With a single
+	process, games are played in the calling process, which logs as usual.
+	"""
+	if seed is None:
+		seed = RandomStream().seed_value
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	tasks = ((i, fork_seed(seed, i)) for i in range(count))
+
+	if processes == 1:
+		_init_worker(config)
+		for task in tasks:
+			yield _play(task)
+		return
+
+	# Forked workers share the card database loaded by the parent
+	from . import cards
+	# Big enough chunks to keep the workers busy, small enough to stream
+	chunksize = max(1, min(64, count // (processes * 4)))
+	with multiprocessing.Pool(processes, _init_worker, (config, log)) as pool:
+		for result in pool.imap_unordered(_play, tasks, chunksize):
+			yield result
+
+
+def _deck(value):
+	return value.split(",")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Play games in parallel.")
+	parser.add_argument("-n", "--games", type=int, default=100, help="number of games")
+	parser.add_argument("-j", "--processes", type=int, help="worker processes (default: one per CPU)")
+	parser.add_argument("--seed", help="seed of the whole run (default: random)")
+	parser.add_argument("--hero1", default="MAGE")
+	parser.add_argument("--hero2", default="WARRIOR")
+	parser.add_argument("--deck1", type=_deck, help="comma separated card IDs (default: random)")
+	parser.add_argument("--deck2", type=_deck, help="comma separated card IDs (default: random)")
+	parser.add_argument("--agent1", default="random", help="agent name or module:function")
+	parser.add_argument("--agent2", default="random", help="agent name or module:function")
+	parser.add_argument("--brawl", help="game class from fireplace.brawls")
+	parser.add_argument("--max-turns", type=int, default=MAX_TURNS)
+	parser.add_argument("--log", action="store_true", help="log the games to stderr")
+	args = parser.parse_args()
+
+	if args.log:
+		logging.basicConfig(level=logging.DEBUG)
+	else:
+		set_enabled(False)
+
+	seed = args.seed
+	if seed is None:
+		seed = RandomStream().seed_value
+	wins = {}
+	t = time.perf_counter()
+	results = simulate(
+		args.games, seed, args.processes, args.log,
+		hero1=args.hero1, hero2=args.hero2, deck1=args.deck1, deck2=args.deck2,
+		agent1=args.agent1, agent2=args.agent2, brawl=args.brawl, max_turns=args.max_turns,
+	)
+	for result in results:
+		wins[result["winner"]] = wins.get(result["winner"], 0) + 1
+		sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+		sys.stdout.flush()
+	elapsed = time.perf_counter() - t
+
+	sys.stderr.write("Seed: %s\n" % (seed))
+	sys.stderr.write("%i games in %.2fs (%.1f games/s)\n" % (args.games, elapsed, args.games / elapsed))
+	sys.stderr.write("Player1 won %i, Player2 won %i, draws: %i\n" % (
+		wins.get("Player1", 0), wins.get("Player2", 0), wins.get(None, 0)
+	))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,100 @@
+"""
+Snapshots of the full state of a game, as compact bytes.
+
+A snapshot is a pickle of the game's entities, in which the immutable card
+data and the event listeners and actions defined by the card scripts are
+referred to by card ID instead of being copied. Those definitions hold the
+lambdas of the card scripts, which cannot be pickled, and are the same in
+every process which loaded the cards.
+Snapshots are meant to move games between the processes of a same version
+of fireplace (eg. to worker processes), not to be stored for the long term.
+"""
+import io
+import pickle
+import zlib
+from .actions import Action, EventListener
+
+
+MAGIC = b"FPSS\x01"
+
+# zlib level: snapshots are made and decoded often, favour speed
+COMPRESSION = 1
+
+# {id(object): reference} and {reference: object} of the script definitions
+_references = None
+_definitions = None
+
+
+def _walk(value, found):
+	if isinstance(value, (list, tuple)):
+		for item in value:
+			_walk(item, found)
+	elif isinstance(value, EventListener):
+		found.append(value)
+		_walk(value.trigger, found)
+		_walk(value.actions, found)
+	elif isinstance(value, Action):
+		found.append(value)
+		_walk(value._args, found)
+
+
+def _build_references():
+	"""
+	Enumerate the event listeners and actions defined by every card script,
+	in an order which only depends on the card definitions.
+	"""
+	global _references, _definitions
+	from . import cards
+	references = {}
+	definitions = {}
+	for card_id, card in cards.db.items():
+		references[id(card)] = card_id
+		definitions[card_id] = card
+		scripts = getattr(card, "scripts", None)
+		if scripts is None:
+			continue
+		found = []
+		for name in sorted(dir(scripts)):
+			if not name.startswith("__"):
+				_walk(getattr(scripts, name), found)
+		for i, obj in enumerate(found):
+			definitions[card_id, i] = obj
+			# Definitions shared by several cards keep their first reference
+			references.setdefault(id(obj), (card_id, i))
+	_references, _definitions = references, definitions
+
+
+class _Pickler(pickle.Pickler):
+	def persistent_id(self, obj):
+		return _references.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+	def persistent_load(self, reference):
+		try:
+			return _definitions[reference]
+		except KeyError:
+			raise pickle.UnpicklingError("Unknown card definition: %r" % (reference, ))
+
+
+def dumps(game):
+	"""
+	Returns a snapshot of \a game, see Game.snapshot().
+	"""
+	if _references is None:
+		_build_references()
+	buf = io.BytesIO()
+	_Pickler(buf, pickle.HIGHEST_PROTOCOL).dump(game)
+	return MAGIC + zlib.compress(buf.getvalue(), COMPRESSION)
+
+
+def loads(data):
+	"""
+	Returns the game in the snapshot \a data, see Game.from_snapshot().
+	"""
+	if data[:len(MAGIC)] != MAGIC:
+		raise ValueError("Not a game snapshot")
+	if _definitions is None:
+		_build_references()
+	buf = io.BytesIO(zlib.decompress(data[len(MAGIC):]))
+	return _Unpickler(buf).load()
@@ -2,7 +2,6 @@
 Targeting logic
 """
 
-import random
 from enum import IntEnum
 from .enums import Affiliation, CardType, PlayReq, GameTag, Race, Zone
 from .utils import CardList
@@ -85,11 +84,229 @@ def is_valid_target(self, target, requirements=None):
 	return True
 
 
+_FILTER = 1
+_MERGE = 2
+
+
+# Code templates for the tests of the IntEnum ops, inlined in compiled
+# selectors. The op itself is available as {op}.
+_INLINE_TESTS = {
+	CardType.test: "({op} == entity.type)",
+	GameTag.test: "bool(entity.tags.get({op}))",
+	Race.test: "({op} == getattr(entity, 'race', _RACE_INVALID))",
+	Zone.test: "({op} == getattr(entity, 'zone', _ZONE_INVALID))",
+}
+
+
+# The zones, affiliations and card types an entity can have to match a
+# test, as a (zones, affiliations, types) tuple. None means "any".
+_ANY = (None, None, None)
+
+
+def _plan_and(a, b):
+	return tuple(y if x is None else x if y is None else x & y for x, y in zip(a, b))
+
+
+def _plan_or(a, b):
+	return tuple(None if x is None or y is None else x | y for x, y in zip(a, b))
+
+
+def _plan_op(op):
+	if isinstance(op, Zone):
+		return (frozenset([op]), None, None)
+	elif isinstance(op, Affiliation) and op != Affiliation.TARGET:
+		return (None, frozenset([op]), None)
+	elif isinstance(op, CardType) and op != CardType.SECRET:
+		return (None, None, frozenset([op]))
+	return _ANY
+
+
+def _interpret_test(selector, program, pc):
+	"""
+	Build a predicate(entity, source) which runs the test program starting
+	at \a pc on a stack at runtime, exactly like the interpreter did.
+	Used for tests containing callable ops the compiler knows nothing about.
+	Returns the predicate, its plan and the program counter after the test.
+	"""
+	start = pc
+	while pc < len(program):
+		op = program[pc]
+		if op is Selector.Merge or op is Selector.MergeFilter:
+			break
+		pc += 1
+	ops = program[start:pc]
+	if pc < len(program):
+		pc += 1
+
+	def predicate(entity, source):
+		stack = []
+		for op in ops:
+			if callable(op):
+				op(selector, stack)
+			else:
+				stack.append(type(op).test(op, entity, source))
+		return stack[-1]
+	return predicate, _ANY, pc
+
+
+def _compile_test(selector, program, pc):
+	"""
+	Compile the test program starting at \a pc, up to the next Merge or
+	MergeFilter op (or the end of the program), into a function
+	predicate(entity, source).
+	Returns the predicate, its plan (see _plan_candidates()) and the program
+	counter after the test.
+	"""
+	start = pc
+	stack = []
+	plans = []
+	namespace = {
+		"_RACE_INVALID": Race.INVALID,
+		"_ZONE_INVALID": Zone.INVALID,
+	}
+	while pc < len(program):
+		op = program[pc]
+		pc += 1
+		if op is Selector.Merge or op is Selector.MergeFilter:
+			break
+		if op is Selector._and:
+			a = stack.pop()
+			b = stack.pop()
+			stack.append("(%s and %s)" % (b, a))
+			plans.append(_plan_and(plans.pop(), plans.pop()))
+		elif op is Selector._or:
+			a = stack.pop()
+			b = stack.pop()
+			stack.append("(%s or %s)" % (b, a))
+			plans.append(_plan_or(plans.pop(), plans.pop()))
+		elif op is Selector._not:
+			stack.append("(not %s)" % (stack.pop()))
+			plans.pop()
+			plans.append(_ANY)
+		elif callable(op):
+			# Unknown stack op: run the whole test at runtime instead
+			return _interpret_test(selector, program, start)
+		else:
+			plans.append(_plan_op(op))
+			name = "_op%i" % (len(namespace))
+			namespace[name] = op
+			test = type(op).test
+			if isinstance(op, CardType) and op == CardType.SECRET:
+				stack.append("getattr(entity, 'secret', False)")
+			elif test in _INLINE_TESTS:
+				stack.append(_INLINE_TESTS[test].format(op=name))
+			else:
+				namespace[name + "_test"] = test
+				stack.append("%s_test(%s, entity, source)" % (name, name))
+
+	if not stack:
+		def predicate(entity, source):
+			raise IndexError("Empty selector test")
+		return predicate, _ANY, pc
+
+	code = "lambda entity, source: %s" % (stack[-1])
+	return eval(code, namespace), plans[-1], pc
+
+
+# Card types which can be found in the PLAY Zone of a game's entities
+_PLANNED_TYPES = frozenset([
+	CardType.HERO, CardType.HERO_POWER, CardType.MINION, CardType.PLAYER,
+	CardType.SPELL, CardType.WEAPON,
+])
+_PLANNED_ZONES = frozenset([Zone.DECK, Zone.HAND, Zone.PLAY, Zone.SECRET])
+
+
+def _plan_candidates(game, source, plan):
+	"""
+	Returns the narrowest list of candidates in \a game for a test with
+	the given \a plan, or None if the whole game has to be tested.
+	The candidates are in the same order as they are in the game's
+	all_entities, so that the test results are exactly the same.
+	"""
+	zones, affiliations, types = plan
+	if zones is None or not zones <= _PLANNED_ZONES:
+		return None
+	if Zone.PLAY in zones and (types is None or not types <= _PLANNED_TYPES):
+		return None
+
+	players = game.players
+	controller = getattr(source, "controller", None)
+	if affiliations is not None and controller is not None:
+		players = [player for player in players if (
+			(Affiliation.FRIENDLY in affiliations and player is controller) or
+			(Affiliation.HOSTILE in affiliations and player is not controller)
+		)]
+
+	ret = []
+	# Same order as BaseGame.all_entities and Player.entities
+	for player in players:
+		if Zone.PLAY in zones:
+			hero = player.hero
+			if hero:
+				if CardType.HERO in types:
+					ret.append(hero)
+				if CardType.HERO_POWER in types and hero.power:
+					ret.append(hero.power)
+				if CardType.WEAPON in types and player.weapon:
+					ret.append(player.weapon)
+			if CardType.MINION in types:
+				ret += player.field
+		if Zone.SECRET in zones and not player.current_player:
+			ret += player.secrets
+		if Zone.PLAY in zones and CardType.PLAYER in types:
+			ret.append(player)
+	if Zone.HAND in zones:
+		for player in players:
+			ret += player.hand
+	if Zone.DECK in zones:
+		for player in players:
+			ret += player.deck
+	return ret
+
+
+def _compile_program(selector, program):
+	"""
+	Compile the \a program of \a selector into a list of stages.
+	This follows the same control flow as the Forth-like program: the ops
+	are split into tests, merges and boolean ops on the merged collections.
+	"""
+	stages = []
+	opc = 0
+	while opc < len(program):
+		if program[opc] is not Selector.MergeFilter:
+			predicate, plan, opc = _compile_test(selector, program, opc)
+			stages.append((_FILTER, predicate, plan))
+			if opc >= len(program):
+				break
+		else:
+			opc += 1
+		# merge step:
+		predicate, plan, opc = _compile_test(selector, program, opc)
+		merges = []
+		while opc < len(program):
+			op = program[opc]
+			opc += 1
+			if op is Selector.Unmerge:
+				break
+			merges.append(op)
+		ops = []
+		while opc < len(program):
+			op = program[opc]
+			if op not in (Selector._or, Selector._and, Selector._not):
+				break
+			ops.append(op)
+			opc += 1
+		stages.append((_MERGE, predicate, plan, merges, ops))
+	return stages
+
+
 class Selector:
 	"""
 	A Forth-like program consisting of methods of Selector and members of
 	IntEnum classes. The IntEnums must have appropriate test(entity)
 	methods returning a boolean, true if entity matches the condition.
+	Selectors are shared by every card and every game: evaluating one must
+	never store any state on the selector (besides its compiled program).
 	"""
 	class MergeFilter:
 		"""
@@ -100,7 +317,7 @@ class Selector:
 
 	class Merge:
 		"""
-		Ops between Merge and Unmerge are classes with merge(selector, entities)
+		Ops between Merge and Unmerge are classes with merge(selector, entities, source)
 		methods that operate on the full collection specified by the ops between
 		MergeFilter and Merge.
 		"""
@@ -149,34 +366,59 @@ class Selector:
 		result.program += [Selector._not, Selector._and]
 		return result
 
+	@property
+	def program(self):
+		return self._program
+
+	@program.setter
+	def program(self, value):
+		self._program = value
+		self._compiled = None
+
+	def compile(self):
+		"""
+		Compile the program into a list of stages, cached on the selector.
+		Each stage is either (FILTER, predicate, plan) or
+		(MERGE, predicate, plan, merge ops, boolean ops on the merged collection).
+		"""
+		if self._compiled is None:
+			self._compiled = _compile_program(self, self.program)
+		return self._compiled
+
 	def eval(self, entities, source):
 		if not entities:
 			return []
-		self.opc = 0  # outer program counter
+		game = None
+		if getattr(entities, "type", None) == CardType.GAME:
+			# Evaluating on the whole game: each test picks its candidates
+			game = entities
+			entities = None
+		elif not isinstance(entities, list):
+			entities = list(entities)
 		result = []
-		while self.opc < len(self.program):
-			if self.program[self.opc] != Selector.MergeFilter:
-				result += [e for e in entities if self.test(e, source)]
-				self.opc = self.pc
-				if self.opc >= len(self.program):
-					break
-			else:
-				self.opc += 1
-			# handle merge step:
-			merge_input = CardList([e for e in entities if self.test(e, source)])
-			self.opc = self.pc
+		for stage in self.compile():
+			predicate, plan = stage[1:3]
+			candidates = entities
+			if game is not None:
+				candidates = _plan_candidates(game, source, plan)
+				if candidates is None:
+					if entities is None:
+						entities = list(game)
+					candidates = entities
+
+			if stage[0] == _FILTER:
+				result += [e for e in candidates if predicate(e, source)]
+				continue
+
+			merges, ops = stage[3:]
+			merge_input = CardList([e for e in candidates if predicate(e, source)])
 			merge_output = CardList()
-			while self.opc < len(self.program):
-				op = self.program[self.opc]
-				self.opc += 1
-				if op == Selector.Unmerge:
-					break
-				merge_output += op.merge(self, merge_input)
+			for op in merges:
+				merge_output += op.merge(self, merge_input, source)
 			negated = False
 			combined = False
-			while self.opc < len(self.program):
+			for op in ops:
 				# special handling for operators on merged collections:
-				op = self.program[self.opc]
 				if op == Selector._or:
 					result += [e for e in merge_output]
 					combined = True
@@ -185,28 +427,14 @@ class Selector:
 					combined = True
 				elif op == Selector._not:
 					negated = not negated
-				else:
-					break
-				self.opc += 1
 			if not combined:
 				# assume or
 				result += merge_output
 		return result
 
 	def test(self, entity, source):
-		stack = []
-		self.pc = self.opc  # program counter
-		while self.pc < len(self.program):
-			op = self.program[self.pc]
-			self.pc += 1
-			if op == Selector.Merge or op == Selector.MergeFilter:
-				break
-			if callable(op):
-				op(self, stack)
-			else:
-				val = type(op).test(op, entity, source)
-				stack.append(val)
-		return stack[-1]
+		stages = self.compile()
+		return stages[0][1](entity, source)
 
 	# boolean ops:
 	def _and(self, stack):
@@ -290,7 +518,7 @@ class AdjacentSelector(Selector):
 	Selects the minions adjacent to the targets.
 	"""
 	class SelectAdjacent:
-		def merge(self, selector, entities):
+		def merge(self, selector, entities, source):
 			result = []
 			for e in entities:
 				result.extend(e.adjacent_minions)
@@ -316,10 +544,10 @@ class RandomSelector(Selector):
 		def __init__(self, times):
 			self.times = times
 
-		def merge(self, selector, entities):
+		def merge(self, selector, entities, source):
 			if not entities and self.fallback:
 				return [self.fallback]
-			return random.sample(entities, min(len(entities), self.times))
+			return source.game.random.sample(entities, min(len(entities), self.times))
 
 	def __init__(self, selector):
 		self.random = self.SelectRandom(1)
@@ -334,11 +562,15 @@ class RandomSelector(Selector):
 	def __mul__(self, other):
 		result = RandomSelector(self.selector)
 		result.random.times = self.random.times * other
+		result.random.fallback = self.random.fallback
 		return result
 
 	def __or__(self, other):
-		self.random.fallback = other
-		return self
+		# Selectors are shared, so never modify self
+		result = RandomSelector(self.selector)
+		result.random.times = self.random.times
+		result.random.fallback = other
+		return result
 
 RANDOM = RandomSelector
 
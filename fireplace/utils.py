@@ -1,4 +1,141 @@
+import random
+
+
+class RandomStream(random.Random):
+	"""
+	A seedable random number generator, which can fork independent
+	streams: fork(name) always returns the same stream for the same seed
+	and name. Without a seed, one is drawn from the random module.
+	"""
+	def __init__(self, seed=None):
+		if seed is None:
+			seed = random.getrandbits(64)
+		self.seed_value = seed
+		super().__init__(seed)
+
+	def __repr__(self):
+		return "<%s (%r)>" % (self.__class__.__name__, self.seed_value)
+
+	def __reduce__(self):
+		return (self.__class__, (self.seed_value, ), self.getstate())
+
+	def fork(self, name):
+		"""
+		Returns the sub-stream \a name, which does not depend on nor
+		affect the draws made on this stream.
+		"""
+		return self.__class__(fork_seed(self.seed_value, name))
+
+
+def fork_seed(seed, name):
+	"""
+	Returns the seed of the stream \a name forked from the seed \a seed,
+	without seeding a generator (see RandomStream.fork()).
+	"""
+	return "%s/%s" % (seed, name)
+
+
+def invalidate_caches(game):
+	"""
+	Invalidate every cached stat and view of the entities of \a game, after
+	they changed (see entity.cached_view()).
+	"""
+	# Written directly: the version is neither journaled nor a tag
+	game.__dict__["_state_version"] = game._state_version + 1
+
+
+class Journal(object):
+	"""
+	Log of the changes made to the entities and card lists of a game since
+	its oldest checkpoint, which can be undone in place (see Game.checkpoint()).
+	"""
+	def __init__(self):
+		self.entries = []
+		# Containers snapshotted since the last checkpoint or rollback
+		self.saved = set()
+
+	def checkpoint(self, obj, state):
+		"""
+		Returns a new checkpoint. \a state is restored with
+		obj._undo(None, state) whenever the journal is rolled back to it,
+		for the state which is not held by entities and card lists.
+		"""
+		self.saved.clear()
+		self.entries.append((obj, None, state))
+		return len(self.entries) - 1
+
+	def record(self, obj, key, value):
+		"""
+		Record that \a key of \a obj was \a value, to be restored with
+		obj._undo(key, value) on rollback.
+		"""
+		self.entries.append((obj, key, value))
+
+	def save(self, container):
+		"""
+		Snapshot \a container before its first change since the last checkpoint.
+		"""
+		if id(container) not in self.saved:
+			self.saved.add(id(container))
+			self.entries.append((container, None, container._snapshot()))
+
+	def rollback(self, checkpoint):
+		"""
+		Undo every change made since \a checkpoint, most recent first.
+		The checkpoint itself is kept, so it can be rolled back to again.
+		"""
+		entries = self.entries
+		assert checkpoint < len(entries), "Checkpoint was already rolled back"
+		while len(entries) > checkpoint + 1:
+			obj, key, value = entries.pop()
+			obj._undo(key, value)
+		obj, key, value = entries[checkpoint]
+		obj._undo(key, value)
+		self.saved.clear()
+
+
+def _journaled(method):
+	"""
+	Wraps a mutator \a method of a container, so that its changes are
+	journaled by and invalidate the caches of the game of the entity which
+	holds the container (see Entity.__setattr__()).
+	"""
+	def func(self, *args, **kwargs):
+		owner = self._owner
+		if owner is not None:
+			game = getattr(owner, "game", None)
+			if game is not None:
+				invalidate_caches(game)
+				journal = game._journal
+				if journal is not None:
+					journal.save(self)
+		return method(self, *args, **kwargs)
+	func.__name__ = method.__name__
+	return func
+
+
 class CardList(list):
+	# The entity holding the list, set when assigned to one of its attributes
+	_owner = None
+
+	append = _journaled(list.append)
+	extend = _journaled(list.extend)
+	insert = _journaled(list.insert)
+	pop = _journaled(list.pop)
+	clear = _journaled(list.clear)
+	sort = _journaled(list.sort)
+	reverse = _journaled(list.reverse)
+	__setitem__ = _journaled(list.__setitem__)
+	__delitem__ = _journaled(list.__delitem__)
+	__iadd__ = _journaled(list.__iadd__)
+	__imul__ = _journaled(list.__imul__)
+
+	def _snapshot(self):
+		return list(self)
+
+	def _undo(self, key, value):
+		list.__setitem__(self, slice(None), value)
+
 	def __contains__(self, x):
 		for item in self:
 			if x is item:
@@ -35,37 +172,283 @@ class CardList(list):
 		return self.__class__(e for k, v in kwargs.items() for e in self if getattr(e, k, 0) == v)
 
 
-def random_draft(hero, exclude=[]):
+class CardView(CardList):
 	"""
-	Return a deck of 30 random cards from the \a hero's collection
+	A read-only CardList, as returned by cached views such as Game.board.
+	Copy it (eg. with list() or slicing) to get a list which can be changed.
 	"""
-	import random
-	from . import cards
+	def _read_only(self, *args, **kwargs):
+		raise TypeError("%s is read-only" % (self.__class__.__name__))
+
+	append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+	__setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+	def __reduce__(self):
+		return (self.__class__, (list(self), ))
+
+	def exclude(self, *args, **kwargs):
+		return CardList(self).exclude(*args, **kwargs)
+
+	def filter(self, **kwargs):
+		return CardList(self).filter(**kwargs)
+
+
+class IdentityDict(object):
+	"""
+	A mapping keyed by the identity of its keys (Cards compare equal by id).
+	Unlike a dict keyed by id(), it stays valid when copied or pickled.
+	"""
+	__slots__ = ("_items", "_owner")
+
+	def __init__(self):
+		self._items = {}
+		self._owner = None
+
+	def _snapshot(self):
+		return self._items.copy()
+
+	def _undo(self, key, value):
+		self._items = value
+
+	def __repr__(self):
+		# Keys are usually unhashable cards: list the pairs instead of a dict
+		return "%s(%r)" % (self.__class__.__name__, list(self._items.values()))
+
+	def __len__(self):
+		return len(self._items)
+
+	def __iter__(self):
+		return (key for key, value in self._items.values())
+
+	def __contains__(self, key):
+		return id(key) in self._items
+
+	def __getitem__(self, key):
+		return self._items[id(key)][1]
+
+	@_journaled
+	def __setitem__(self, key, value):
+		self._items[id(key)] = (key, value)
+
+	@_journaled
+	def __delitem__(self, key):
+		del self._items[id(key)]
+
+	def __reduce__(self):
+		return (self.__class__, (), (None, {"_owner": self._owner}), None, iter(self.items()))
+
+	def get(self, key, default=None):
+		item = self._items.get(id(key))
+		if item is None:
+			return default
+		return item[1]
+
+	@_journaled
+	def pop(self, key, *default):
+		item = self._items.pop(id(key), None)
+		if item is None:
+			if default:
+				return default[0]
+			raise KeyError(key)
+		return item[1]
+
+	def items(self):
+		return self._items.values()
+
+	def values(self):
+		return (value for key, value in self._items.values())
+
+
+class ZoneList(CardList):
+	"""
+	A CardList for the cards in a zone (hand, deck, field...), which holds
+	every card at most once. It keeps track of the position of each card so
+	that membership tests, index() and remove() do not have to scan the list.
+	"""
+	def __init__(self, cards=()):
+		super().__init__(cards)
+		self._positions = {}
+		self._reindex(0)
+
+	def __reduce__(self):
+		# The positions are keyed by id() and must be rebuilt on copy
+		state = self.__dict__.copy()
+		del state["_positions"], state["_valid"]
+		return (self.__class__, (list(self), ), state)
+
+	def _reindex(self, start):
+		"""
+		Positions are exact before self._valid. Positions from \a start
+		onwards are recomputed.
+		"""
+		positions = self._positions
+		for i in range(start, len(self)):
+			positions[id(self[i])] = i
+		self._valid = len(self)
+
+	def _invalidate(self, start):
+		self._valid = min(self._valid, start)
+
+	def _reset(self):
+		self._positions.clear()
+		self._reindex(0)
+
+	def _undo(self, key, value):
+		super()._undo(key, value)
+		self._reset()
+
+	def __contains__(self, x):
+		return id(x) in self._positions
+
+	def index(self, x):
+		i = self._positions.get(id(x))
+		if i is None:
+			raise ValueError
+		if i >= self._valid:
+			self._reindex(self._valid)
+			i = self._positions[id(x)]
+		return i
+
+	def remove(self, x):
+		i = self.index(x)
+		super().__delitem__(i)
+		del self._positions[id(x)]
+		self._invalidate(i)
+
+	def append(self, x):
+		assert id(x) not in self._positions, "%r is already in %r" % (x, self)
+		super().append(x)
+		self._positions[id(x)] = len(self) - 1
+		if self._valid == len(self) - 1:
+			self._valid += 1
+
+	def extend(self, iterable):
+		for x in iterable:
+			self.append(x)
+
+	def __iadd__(self, iterable):
+		self.extend(iterable)
+		return self
+
+	def insert(self, i, x):
+		assert id(x) not in self._positions, "%r is already in %r" % (x, self)
+		if i < 0:
+			i = max(0, i + len(self))
+		i = min(i, len(self))
+		super().insert(i, x)
+		self._positions[id(x)] = i
+		self._invalidate(i)
+
+	def pop(self, i=-1):
+		if i < 0:
+			i += len(self)
+		x = super().pop(i)
+		del self._positions[id(x)]
+		self._invalidate(i)
+		return x
+
+	def clear(self):
+		super().clear()
+		self._positions.clear()
+		self._valid = 0
+
+	def __setitem__(self, i, x):
+		if isinstance(i, slice):
+			super().__setitem__(i, x)
+			self._reset()
+			return
+		if i < 0:
+			i += len(self)
+		old = self[i]
+		super().__setitem__(i, x)
+		# When swapping cards (eg. random.shuffle), old may already be elsewhere
+		if self._positions.get(id(old)) == i:
+			del self._positions[id(old)]
+		self._positions[id(x)] = i
+
+	def __delitem__(self, i):
+		super().__delitem__(i)
+		self._reset()
+
+	def reverse(self):
+		super().reverse()
+		self._reset()
+
+	def sort(self, *args, **kwargs):
+		super().sort(*args, **kwargs)
+		self._reset()
+
+	def exclude(self, *args, **kwargs):
+		return CardList(self).exclude(*args, **kwargs)
+
+	def filter(self, **kwargs):
+		return CardList(self).filter(**kwargs)
+
+
+# Cache of {(card_class, excluded ids): collection} for random_draft()
+_collections = {}
+
+
+def _draft_collection(card_class, exclude=()):
+	"""
+	Return a tuple of the collectible card data which can be drafted
+	in a \a card_class deck, minus the card IDs in \a exclude.
+	"""
+	key = (card_class, frozenset(exclude))
+	if key not in _collections:
+		from . import cards
+		from .enums import CardType
+
+		collection = []
+		for id in cards.filter(collectible=True):
+			if id in exclude:
+				continue
+			cls = getattr(cards, id)
+			if cls.type == CardType.HERO:
+				# Heroes are collectible...
+				continue
+			if cls.card_class and cls.card_class != card_class:
+				continue
+			collection.append(cls)
+		_collections[key] = tuple(collection)
+	return _collections[key]
+
+
+def _draft(collection, rng):
 	from .deck import Deck
-	from .enums import CardType, Rarity
+	from .enums import Rarity
 
 	deck = []
-	collection = []
-	hero = getattr(cards, hero)
-
-	for card in cards.cardlist:
-		if card in exclude:
-			continue
-		cls = getattr(cards, card)
-		if not cls.collectible:
-			continue
-		if cls.type == CardType.HERO:
-			# Heroes are collectible...
-			continue
-		if cls.card_class and cls.card_class != hero.card_class:
-			continue
-		collection.append(cls)
-
+	counts = {}
 	while len(deck) < Deck.MAX_CARDS:
-		card = random.choice(collection)
-		if card.rarity == Rarity.LEGENDARY and card.id in deck:
-			continue
-		elif deck.count(card.id) < Deck.MAX_UNIQUE_CARDS:
+		card = rng.choice(collection)
+		if card.rarity == Rarity.LEGENDARY:
+			limit = Deck.MAX_UNIQUE_LEGENDARIES
+		else:
+			limit = Deck.MAX_UNIQUE_CARDS
+		count = counts.get(card.id, 0)
+		if count < limit:
+			counts[card.id] = count + 1
 			deck.append(card.id)
 
 	return deck
+
+
+def random_draft(hero, exclude=[], seed=None):
+	"""
+	Return a deck of 30 random cards from the \a hero's collection.
+	The same \a seed always returns the same deck.
+	"""
+	return random_drafts(hero, 1, seed, exclude)[0]
+
+
+def random_drafts(hero, n, seed=None, exclude=[]):
+	"""
+	Return a list of \a n random decks from the \a hero's collection.
+	The same \a seed always returns the same decks.
+	"""
+	from . import cards
+
+	collection = _draft_collection(getattr(cards, hero).card_class, exclude)
+	rng = RandomStream(seed)
+	return [_draft(collection, rng) for i in range(n)]
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+"""
+Fireplace benchmarks.
+Usage: ./benchmark.py [benchmark...]
+Runs every benchmark if none are given.
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CARDS_DIR = os.path.join(ROOT, "fireplace", "cards")
+XMLFILE = os.path.join(CARDS_DIR, "enUS.xml")
+DBFILE = os.path.join(CARDS_DIR, "enUS.db")
+REPEAT = 5
+
+
+def run_python(code):
+	"""
+	Run \a code in a fresh interpreter and return its stdout.
+	"""
+	env = os.environ.copy()
+	env["PYTHONPATH"] = ROOT
+	output = subprocess.check_output([sys.executable, "-c", code], env=env)
+	return output.decode().strip()
+
+
+def timed_python(code):
+	"""
+	Return the best wall clock time of \a code over REPEAT fresh interpreters.
+	The code must print its own timing.
+	"""
+	return min(float(run_python(code)) for i in range(REPEAT))
+
+
+def bench_import():
+	"""
+	Cold startup: parsing the XML versus loading the compiled card database.
+	"""
+	from fireplace import cardxml
+	db = cardxml.load(XMLFILE)
+	cardxml.dump(db, cardxml._header(XMLFILE), DBFILE)
+
+	xml_time = timed_python(
+		"import time; t = time.perf_counter()\n"
+		"from fireplace import cardxml\n"
+		"cardxml.load(%r)\n"
+		"print(time.perf_counter() - t)" % (XMLFILE)
+	)
+	db_time = timed_python(
+		"import time; t = time.perf_counter()\n"
+		"from fireplace import cardxml\n"
+		"cardxml.load_cached(%r, %r)\n"
+		"print(time.perf_counter() - t)" % (XMLFILE, DBFILE)
+	)
+	import_time = timed_python(
+		"import time; t = time.perf_counter()\n"
+		"import fireplace.cards\n"
+		"print(time.perf_counter() - t)"
+	)
+	print("Card database from XML:     %.3fs" % (xml_time))
+	print("Card database from cache:   %.3fs (%.1fx)" % (db_time, xml_time / db_time))
+	print("import fireplace.cards:     %.3fs" % (import_time))
+
+
+RSS = (
+	"def rss():\n"
+	"	with open('/proc/self/statm') as f:\n"
+	"		return int(f.read().split()[1]) * resource.getpagesize() / 1024 / 1024\n"
+)
+
+
+def bench_memory():
+	"""
+	Resident memory of a worker process before and after loading the cards.
+	The first figure is what keeping the parsed XML tree alive would cost.
+	"""
+	tree_rss = run_python(
+		"import gc, resource\n" + RSS +
+		"before = rss()\n"
+		"from xml.etree import ElementTree\n"
+		"xml = ElementTree.parse(%r)\n"
+		"gc.collect()\n"
+		"print('%%.1f %%.1f' %% (before, rss()))" % (XMLFILE)
+	)
+	cards_rss = run_python(
+		"import gc, resource\n" + RSS +
+		"before = rss()\n"
+		"import fireplace.cards\n"
+		"gc.collect()\n"
+		"print('%.1f %.1f' % (before, rss()))"
+	)
+	before, after = tree_rss.split()
+	print("Retained XML tree:          %s MiB -> %s MiB RSS" % (before, after))
+	before, after = cards_rss.split()
+	print("import fireplace.cards:     %s MiB -> %s MiB RSS" % (before, after))
+
+
+def _prepare_game():
+	from fireplace.cards.heroes import MAGE, WARRIOR
+	from fireplace.game import Game
+	from fireplace.player import Player
+	from fireplace.utils import random_draft
+
+	players = []
+	for name, hero in (("Player1", MAGE), ("Player2", WARRIOR)):
+		player = Player(name=name)
+		player.prepare_deck(random_draft(hero=hero), hero)
+		players.append(player)
+	game = Game(players=players)
+	game.start()
+	return game
+
+
+def _juggler_storm(game):
+	# Every summon triggers both Knife Jugglers
+	player = game.player1
+	for juggler in range(2):
+		player.summon("NEW1_019")
+	for i in range(2):
+		for minion in player.field[2:]:
+			minion.destroy()
+		while len(player.field) < 7:
+			player.summon("CS2_231")
+
+
+def _deathrattle_cascade(game):
+	# Abominations damage every character when they die, killing each other
+	for i in range(3):
+		game.player1.summon("EX1_097")
+		game.player2.summon("EX1_097")
+		game.player2.summon("EX1_556")
+	game.player1.field[0].destroy()
+
+
+COMBOS = {
+	"Knife Juggler storm": _juggler_storm,
+	"Deathrattle cascade": _deathrattle_cascade,
+}
+
+
+def bench_combo():
+	"""
+	Action resolution on combo heavy boards, where actions trigger long
+	chains of other actions.
+	"""
+	import time
+
+	for name, combo in sorted(COMBOS.items()):
+		best = None
+		for i in range(REPEAT):
+			game = _prepare_game()
+			t = time.perf_counter()
+			combo(game)
+			elapsed = time.perf_counter() - t
+			best = elapsed if best is None else min(best, elapsed)
+		print("%-26s %.4fs" % (name + ":", best))
+
+
+def _midgame():
+	game = _prepare_game()
+	for i in range(3):
+		game.player1.summon("CS2_182")
+		game.player2.summon("EX1_097")
+	game.end_turn()
+	return game
+
+
+def _best_rate(count, func):
+	import time
+
+	best = None
+	for i in range(REPEAT):
+		t = time.perf_counter()
+		for j in range(count):
+			func()
+		elapsed = time.perf_counter() - t
+		best = elapsed if best is None else min(best, elapsed)
+	return count / best
+
+
+def bench_caching():
+	"""
+	Cost and savings of the stat and view caches (see fireplace.entity):
+	writes to entities, which invalidate them, cached reads, and games
+	played with the caches versus recomputing every stat and view on each
+	read.
+	"""
+	from fireplace import sim
+	from fireplace.entity import Entity
+	from fireplace.logging import set_enabled
+
+	game = _midgame()
+	yeti = game.player1.field[0]
+
+	def write():
+		yeti.num_attacks += 1
+
+	def unchanged_write():
+		yeti.num_attacks = yeti.num_attacks
+
+	def read():
+		return yeti.atk
+
+	def play_games(count=10):
+		for i in range(count):
+			sim.play_game("caching/%i" % (i))
+
+	write_rate = _best_rate(20000, write)
+	unchanged_rate = _best_rate(20000, unchanged_write)
+	read_rate = _best_rate(20000, read)
+	cached = Entity._cached
+	set_enabled(False)
+	try:
+		cached_rate = 10 * _best_rate(1, play_games)
+		Entity._cached = lambda self, attr, compute: compute(self)
+		uncached_read_rate = _best_rate(20000, read)
+		uncached_rate = 10 * _best_rate(1, play_games)
+	finally:
+		Entity._cached = cached
+		set_enabled(True)
+	print("Entity writes:              %.0f writes/s" % (write_rate))
+	print("Unchanged entity writes:    %.0f writes/s" % (unchanged_rate))
+	print("Uncached stat reads:        %.0f reads/s" % (uncached_read_rate))
+	print("Cached stat reads:          %.0f reads/s" % (read_rate))
+	print("Games without caches:       %.1f games/s" % (uncached_rate))
+	print("Games with caches:          %.1f games/s (%.1fx)" % (cached_rate, cached_rate / uncached_rate))
+
+
+def bench_clone():
+	"""
+	Copying a mid-game state, as done by search based AIs for every move
+	they look ahead at: Game.clone() versus a plain deepcopy, which also
+	copies the card data and the card script definitions.
+	"""
+	import copy
+	from fireplace.entity import Entity
+	from fireplace.managers import Manager
+
+	game = _midgame()
+	rate = _best_rate(200, game.clone)
+	hooks = Entity.__deepcopy__, Manager.__deepcopy__
+	del Entity.__deepcopy__, Manager.__deepcopy__
+	try:
+		deepcopy_rate = _best_rate(50, lambda: copy.deepcopy(game))
+	finally:
+		Entity.__deepcopy__, Manager.__deepcopy__ = hooks
+	print("Plain copy.deepcopy():      %.1f clones/s" % (deepcopy_rate))
+	print("Game.clone():               %.1f clones/s (%.1fx)" % (rate, rate / deepcopy_rate))
+
+
+def bench_rollback():
+	"""
+	Looking ahead at a move (ending the turn) on a copy of the game versus
+	in place, reverting it with a checkpoint.
+	"""
+	game = _midgame()
+
+	def clone_move():
+		game.clone().end_turn()
+
+	def undo_move():
+		checkpoint = game.checkpoint()
+		game.end_turn()
+		game.rollback(checkpoint)
+
+	clone_rate = _best_rate(200, clone_move)
+	try:
+		undo_rate = _best_rate(200, undo_move)
+	finally:
+		game.discard_checkpoints()
+	print("Clone and move:             %.1f moves/s" % (clone_rate))
+	print("Move and rollback:          %.1f moves/s" % (undo_rate))
+
+
+def bench_logging():
+	"""
+	Games per second when logging every message, when logging is filtered
+	out by level and when it is disabled (see fireplace.logging).
+	"""
+	import logging
+	import time
+	from fireplace import sim
+	from fireplace.logging import set_enabled
+
+	def games_per_second(count=20):
+		t = time.perf_counter()
+		for i in range(count):
+			sim.play_game("logging/%i" % (i))
+		return count / (time.perf_counter() - t)
+
+	root = logging.getLogger()
+	level = root.level
+	handler = logging.StreamHandler(open(os.devnull, "w"))
+	root.addHandler(handler)
+	try:
+		root.setLevel(logging.DEBUG)
+		debug = games_per_second()
+		root.setLevel(logging.WARNING)
+		filtered = games_per_second()
+		set_enabled(False)
+		disabled = games_per_second()
+	finally:
+		set_enabled(True)
+		root.setLevel(level)
+		root.removeHandler(handler)
+		handler.stream.close()
+	print("Logging at DEBUG:           %.1f games/s" % (debug))
+	print("Logging at WARNING:         %.1f games/s" % (filtered))
+	print("Logging disabled:           %.1f games/s (%.1fx)" % (disabled, disabled / debug))
+
+
+def bench_snapshot():
+	"""
+	Encoding a mid-game state into a snapshot and decoding it back, as done
+	to send games to worker processes.
+	"""
+	from fireplace.game import Game
+
+	game = _midgame()
+	data = game.snapshot()
+	encode_rate = _best_rate(200, game.snapshot)
+	decode_rate = _best_rate(200, lambda: Game.from_snapshot(data))
+	print("Snapshot size:              %i bytes" % (len(data)))
+	print("Game.snapshot():            %.1f snapshots/s" % (encode_rate))
+	print("Game.from_snapshot():       %.1f games/s" % (decode_rate))
+
+
+def bench_replay():
+	"""
+	Replaying recorded games, versus playing them with their agents.
+	"""
+	from fireplace import sim
+	from fireplace.game import GameOver
+	from fireplace.logging import set_enabled
+	from fireplace.replay import Recorder, replay
+	from fireplace.utils import RandomStream
+
+	def record(seed):
+		game = _prepare_game()
+		recorder = Recorder(game)
+		rng = RandomStream(seed)
+		try:
+			while game.turn <= sim.MAX_TURNS:
+				sim.random_agent(game, game.current_player, rng)
+				game.end_turn()
+		except GameOver:
+			pass
+		return recorder.dumps()
+
+	set_enabled(False)
+	try:
+		recorded = [record(i) for i in range(20)]
+		replays = iter(recorded * REPEAT)
+		play_rate = _best_rate(20, lambda: sim.play_game("replay"))
+		replay_rate = _best_rate(20, lambda: replay(next(replays)))
+	finally:
+		set_enabled(True)
+	print("Replay size:                %i bytes max" % (max(len(data) for data in recorded)))
+	print("Playing with agents:        %.1f games/s" % (play_rate))
+	print("Replaying:                  %.1f games/s" % (replay_rate))
+
+
+BENCHMARKS = {
+	"caching": bench_caching,
+	"clone": bench_clone,
+	"combo": bench_combo,
+	"import": bench_import,
+	"logging": bench_logging,
+	"memory": bench_memory,
+	"replay": bench_replay,
+	"rollback": bench_rollback,
+	"snapshot": bench_snapshot,
+}
+
+
+def main():
+	sys.path.insert(0, ROOT)
+	names = sys.argv[1:] or sorted(BENCHMARKS)
+	for name in names:
+		print("== %s ==" % (name))
+		BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+	main()
@@ -7,7 +7,7 @@ from fireplace.cards.heroes import *
 from fireplace.enums import *
 from fireplace.game import Game
 from fireplace.player import Player
-from fireplace.utils import random_draft
+from fireplace.utils import random_draft, random_drafts
 
 
 GOLDSHIRE_FOOTMAN = "CS1_042"
@@ -43,7 +43,7 @@ def _draft(hero, exclude):
 
 _heroes = fireplace.cards.filter(collectible=True, type=CardType.HERO)
 
-def prepare_game(hero1=None, hero2=None, exclude=(), game_class=TestGame):
+def prepare_game(hero1=None, hero2=None, exclude=(), game_class=TestGame, seed=None):
 	print("Initializing a new game")
 	if hero1 is None:
 		hero1 = random.choice(_heroes)
@@ -55,7 +55,7 @@ def prepare_game(hero1=None, hero2=None, exclude=(), game_class=TestGame):
 	player1.prepare_deck(deck1, hero1)
 	player2 = Player(name="Player2")
 	player2.prepare_deck(deck2, hero2)
-	game = game_class(players=(player1, player2))
+	game = game_class(players=(player1, player2), seed=seed)
 	game.start()
 
 	return game
@@ -4066,6 +4066,723 @@ def test_explosive_trap():
 	assert game.player1.hero.health == 30
 
 
+def test_cards_filter():
+	def linear_filter(**kwargs):
+		ret = fireplace.cards.db.values()
+		for attr, value in kwargs.items():
+			ret = [card for card in ret if getattr(card, attr) == value]
+		return [card.id for card in ret]
+
+	filters = (
+		{"collectible": True, "type": CardType.MINION, "cost": 3},
+		{"card_class": CardClass.MAGE, "type": CardType.SPELL},
+		{"race": Race.MURLOC, "rarity": Rarity.LEGENDARY},
+		{"spare_part": True},
+		{"collectible": True, "secret": True},
+	)
+	for kwargs in filters:
+		assert fireplace.cards.filter(**kwargs) == linear_filter(**kwargs)
+	assert fireplace.cards.filter(cost=None, type=CardType.HERO) == linear_filter(type=CardType.HERO)
+	assert not fireplace.cards.filter(cost=1000)
+
+
+def _only_legendaries(card):
+	return card.rarity == Rarity.LEGENDARY and 1 or 0
+
+
+def test_random_card_pools():
+	from fireplace.actions import RandomCardGenerator
+	from fireplace.cards.utils import RandomMinion
+
+	minions = RandomMinion(cost=2)
+	assert minions.cards is RandomMinion(cost=2).cards
+	assert minions.cards is RandomMinion(cost=2, race=None).cards
+	assert list(minions.cards) == fireplace.cards.filter(collectible=True, type=CardType.MINION, cost=2)
+	assert minions.pick() in minions.cards
+
+	sample = minions.sample(5)
+	assert len(sample) == 5
+	assert len(set(sample)) == 5
+	assert len(minions.sample(len(minions.cards) + 1)) == len(minions.cards)
+	assert len(minions.sample(50, replace=True)) == 50
+
+	legendaries = RandomCardGenerator(weight=_only_legendaries, collectible=True, type=CardType.MINION)
+	for id in legendaries.sample(10, replace=True):
+		assert getattr(fireplace.cards, id).rarity == Rarity.LEGENDARY
+	for id in legendaries.sample(10):
+		assert getattr(fireplace.cards, id).rarity == Rarity.LEGENDARY
+	assert RandomCardGenerator(weight=_only_legendaries, collectible=True, type=CardType.MINION).pool is legendaries.pool
+
+	try:
+		RandomCardGenerator(weight=lambda card: 1, collectible=True).pool
+	except ValueError:
+		pass
+	else:
+		assert False, "Lambda weights should be rejected"
+
+
+def test_random_drafts():
+	decks = random_drafts(MAGE, 10, seed=1)
+	assert len(decks) == 10
+	assert decks == random_drafts(MAGE, 10, seed=1)
+	for deck in decks:
+		assert len(deck) == 30
+		for id in deck:
+			card = getattr(fireplace.cards, id)
+			assert card.collectible
+			assert card.card_class in (CardClass.INVALID, CardClass.MAGE)
+			if card.rarity == Rarity.LEGENDARY:
+				assert deck.count(id) == 1
+			else:
+				assert deck.count(id) <= 2
+
+	deck = random_draft(WARRIOR, exclude=(WISP, ))
+	assert len(deck) == 30
+	assert WISP not in deck
+	assert random_draft(WARRIOR, seed=2) == random_draft(WARRIOR, seed=2)
+	assert random_draft(MAGE, seed=1) == decks[0]
+
+
+def test_event_listener_index():
+	from fireplace.actions import Death, EventListener, Summon
+	game = prepare_game()
+	listeners = lambda cls, at: game.listening_entities(cls, at)
+	bolvar = game.player1.give("GVG_063")
+	assert bolvar in listeners(Death, EventListener.ON)
+	juggler = game.player1.give("NEW1_019")
+	assert juggler not in listeners(Summon, EventListener.AFTER)
+	juggler.play()
+	assert juggler in listeners(Summon, EventListener.AFTER)
+	assert juggler not in listeners(Summon, EventListener.ON)
+
+	game.player1.give(SILENCE).play(target=juggler)
+	assert juggler not in listeners(Summon, EventListener.AFTER)
+	game.player1.give(WISP).play()
+	assert game.player2.hero.health == 30
+
+	bolvar.play()
+	assert bolvar not in listeners(Death, EventListener.ON)
+
+
+def test_aura_refresh():
+	game = prepare_game()
+	wisp1 = game.player1.give(WISP)
+	wisp1.play()
+	raidleader = game.player1.summon("CS2_122")
+	aura = raidleader._auras[0]
+	assert not aura.dynamic
+	assert wisp1.atk == 2
+	updates = []
+	update = aura.update
+	aura.update = lambda: (updates.append(aura), update())
+
+	# Nothing the aura depends on changes
+	game.player1.give(MOONFIRE).play(target=game.player2.hero)
+	game.end_turn(); game.end_turn()
+	assert not updates
+	assert wisp1.atk == 2
+
+	wisp2 = game.player1.give(WISP)
+	wisp2.play()
+	assert updates
+	assert wisp2.atk == 2
+
+	# The aura buff is reapplied after a silence
+	game.player1.give(SILENCE).play(target=wisp1)
+	assert wisp1.atk == 2
+
+	raidleader.destroy()
+	assert wisp1.atk == wisp2.atk == 1
+
+
+def test_cache_invalidation():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	version = game._state_version
+	# Unchanged values and attributes no stat depends on keep the caches
+	wisp.num_attacks = wisp.num_attacks
+	wisp.target = game.player2.hero
+	assert game._state_version == version
+	wisp.num_attacks += 1
+	assert game._state_version != version
+
+	checkpoint = game.checkpoint()
+	try:
+		wisp.target = None
+		game.rollback(checkpoint)
+		assert wisp.target is game.player2.hero
+	finally:
+		game.discard_checkpoints()
+
+
+def test_cached_stats():
+	from fireplace import entity
+	game = prepare_game()
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	assert wisp.atk == 1
+	assert wisp._cache["atk"][0] == 1
+	game.player1.give("CS2_122").play()
+	assert wisp.atk == 2
+	game.player1.give(SILENCE).play(target=wisp)
+	assert wisp.atk == 2
+
+	# Changes to other games do not invalidate the cached stats
+	version = game._state_version
+	game2 = game.clone()
+	game2.player1.summon(WISP)
+	prepare_game().player1.summon(WISP)
+	assert game._state_version == version
+	assert wisp._cache["atk"] == (2, version)
+
+	entity.VERIFY_CACHED_STATS = True
+	try:
+		test_amani_berserker()
+		test_old_murkeye()
+		test_raid_leader()
+		test_aura_refresh()
+	finally:
+		entity.VERIFY_CACHED_STATS = False
+
+
+def test_cached_views():
+	from fireplace import entity
+	game = prepare_game()
+	board = game.board
+	assert board is game.board
+	wisp = game.player1.summon(WISP)
+	assert wisp not in board
+	assert wisp in game.board
+	assert game.board is not board
+	assert wisp in game.player1.characters
+	assert wisp in game.player1.live_entities
+	try:
+		game.board.append(wisp)
+	except TypeError:
+		pass
+	else:
+		assert False, "game.board should be read-only"
+
+	# Card lists changed in place invalidate the views too
+	entity.VERIFY_CACHED_STATS = True
+	try:
+		decks = game.decks
+		game.player1.deck.reverse()
+		game.player2.shuffle_deck()
+		assert game.decks is not decks
+		assert list(game.decks) == list(game.players[0].deck) + list(game.players[1].deck)
+		card = game.player1.draw()
+		assert card not in game.decks
+		assert card in game.hands
+		assert card in game.all_entities
+
+		test_dire_wolf_alpha()
+		test_dread_infernal()
+	finally:
+		entity.VERIFY_CACHED_STATS = False
+
+
+def test_zone_lists():
+	game = prepare_game()
+	wisps = [game.player1.summon(WISP) for i in range(4)]
+	field = game.player1.field
+	assert [field.index(wisp) for wisp in wisps] == [0, 1, 2, 3]
+	wisps[1].destroy()
+	assert wisps[1] not in field
+	assert field.index(wisps[2]) == 1
+	assert wisps[2].adjacent_minions == [wisps[0], wisps[3]]
+
+	deck = game.player2.deck
+	card = deck[0]
+	game.player2.shuffle_deck()
+	assert card in deck
+	assert deck[deck.index(card)] is card
+	game.player2.mill(len(deck) - 1)
+	assert len(deck) == 1
+	assert deck.index(deck[0]) == 0
+
+
+def test_death_candidates():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	yeti = game.player1.summon("CS2_182")
+	champion = game.player1.summon("CS2_222")
+	# Summoning outside of an action does not sweep
+	assert [e for e in game._death_candidates] == [wisp, yeti, champion]
+	game.process_deaths()
+	assert not game._death_candidates
+	assert wisp.zone == yeti.zone == champion.zone == Zone.PLAY
+	game.player1.give(MOONFIRE).play(target=wisp)
+	assert wisp.zone == Zone.GRAVEYARD
+	assert not game._death_candidates
+
+	for i in range(5):
+		game.player1.give(MOONFIRE).play(target=yeti)
+	assert yeti.health == 1
+	# Losing the aura's health buff is lethal
+	champion.destroy()
+	assert yeti.zone == Zone.GRAVEYARD
+	assert not game._death_candidates
+
+
+def test_deathrattle_cascade():
+	game = prepare_game()
+	abomination1 = game.player1.summon("EX1_097")
+	abomination2 = game.player1.summon("EX1_097")
+	golem = game.player2.summon("EX1_556")
+	game.player1.give(MOONFIRE).play(target=abomination2)
+	game.player1.give(MOONFIRE).play(target=abomination2)
+	abomination1.destroy()
+	assert abomination1.zone == abomination2.zone == golem.zone == Zone.GRAVEYARD
+	assert len(game.player2.field) == 1
+	assert game.player2.field[0].id == "skele21"
+	assert game.player1.hero.health == game.player2.hero.health == 30 - 2 - 2
+
+
+def test_hit_frames():
+	from fireplace.actions import Hit
+
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	yeti = game.player2.summon("CS2_182")
+	depth = [0, 0]
+	run = Game.run
+
+	def counting_run(self, frame):
+		depth[0] += 1
+		depth[1] = max(depth[1], depth[0])
+		try:
+			return run(self, frame)
+		finally:
+			depth[0] -= 1
+
+	Game.run = counting_run
+	try:
+		# Hits and attacks are resolved within the same run
+		game.queue_actions(game.player1.hero, [Hit(yeti, 1)])
+		assert yeti.health == 4
+		game.attack(wisp, yeti)
+		assert wisp.zone == Zone.GRAVEYARD
+		assert yeti.health == 3
+	finally:
+		Game.run = run
+	assert depth[1] == 1
+
+
+def test_game_clone():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	yeti = game.player2.summon("CS2_182")
+	clone = game.clone()
+	wisp2 = clone.player1.field[0]
+	yeti2 = clone.player2.field[0]
+	assert wisp2 is not wisp
+	assert wisp2.data is wisp.data
+	assert wisp2.uuid != wisp.uuid
+	assert clone.uuid != game.uuid
+	assert wisp2.controller is clone.player1
+	assert wisp2.game is clone
+	# Cards are unhashable, identity keyed maps still have to print
+	assert "Wisp" in repr(clone._death_candidates)
+
+	clone.player1.give(MOONFIRE).play(target=yeti2)
+	assert yeti2.health == 4
+	assert yeti.health == 5
+	game.player1.give(MOONFIRE).play(target=wisp)
+	assert wisp.zone == Zone.GRAVEYARD
+	assert wisp2.zone == Zone.PLAY
+	assert wisp2 in clone.board
+
+	clone.end_turn()
+	assert clone.turn == 2
+	assert game.turn == 1
+	assert clone.current_player is clone.player2
+
+
+def test_checkpoint_rollback():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	yeti = game.player2.summon("CS2_182")
+	hand = list(game.player1.hand)
+	checkpoint = game.checkpoint()
+	try:
+		game.player1.give(MOONFIRE).play(target=wisp)
+		game.player2.summon("CS2_222")
+		assert yeti.atk == 5
+		game.end_turn()
+		assert wisp.zone == Zone.GRAVEYARD
+		assert game.turn == 2
+
+		game.rollback(checkpoint)
+		assert game.turn == 1
+		assert game.current_player is game.player1
+		assert wisp.zone == Zone.PLAY
+		assert list(game.player1.field) == [wisp]
+		assert game.player1.field.index(wisp) == 0
+		assert list(game.player1.hand) == hand
+		assert yeti.atk == 4
+		assert yeti.health == 5
+
+		# The checkpoint can be rolled back to again
+		game.player1.give(MOONFIRE).play(target=yeti)
+		assert yeti.health == 4
+		game.rollback(checkpoint)
+		assert yeti.health == 5
+	finally:
+		game.discard_checkpoints()
+	game.player1.give(MOONFIRE).play(target=wisp)
+	assert wisp.zone == Zone.GRAVEYARD
+
+
+def test_rollback_replays_moves():
+	from fireplace.replay import state_hash
+
+	def move(game):
+		game.player1.give("EX1_277").play()
+		game.end_turn()
+
+	game = prepare_game(MAGE, WARRIOR, seed=3)
+	fresh = prepare_game(MAGE, WARRIOR, seed=3)
+	for g in (game, fresh):
+		for i in range(3):
+			g.player2.summon(WISP)
+	checkpoint = game.checkpoint()
+	try:
+		move(game)
+		game.rollback(checkpoint)
+		assert state_hash(game) == state_hash(fresh)
+		move(game)
+	finally:
+		game.discard_checkpoints()
+	move(fresh)
+	assert state_hash(game) == state_hash(fresh)
+
+
+def test_checkpoint_other_games():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	clone = game.clone()
+	other = prepare_game()
+	checkpoint = game.checkpoint()
+	try:
+		entries = len(game._journal.entries)
+		wisp2 = clone.player1.field[0]
+		clone.player1.give(MOONFIRE).play(target=wisp2)
+		yeti = other.player2.summon("CS2_182")
+		other.end_turn()
+		assert len(game._journal.entries) == entries
+		assert clone._journal is None
+
+		game.player1.summon(WISP)
+		game.rollback(checkpoint)
+		assert list(game.player1.field) == [wisp]
+		assert wisp2.zone == Zone.GRAVEYARD
+		assert not clone.player1.field
+		assert yeti in other.player2.field
+		assert other.turn == 2
+	finally:
+		game.discard_checkpoints()
+
+
+def test_seeded_games():
+	from fireplace.utils import RandomStream
+
+	def play_game(seed):
+		game = prepare_game(MAGE, WARRIOR, seed=seed)
+		for i in range(4):
+			game.player1.summon(WISP)
+			game.player2.summon(WISP)
+		game.current_player.give("EX1_277").play()
+		game.current_player.summon("GVG_110t").destroy()
+		return (
+			game.current_player.name,
+			[card.id for card in game.player1.hand],
+			[card.id for card in game.player2.deck],
+			len(game.player1.field), len(game.player2.field),
+			game.player1.hero.health, game.player2.hero.health,
+		)
+
+	assert play_game(42) == play_game(42)
+	assert len(set(str(play_game(seed)) for seed in range(8))) > 1
+
+	rng = RandomStream(7)
+	fork = rng.fork("shuffle")
+	assert rng.random() == RandomStream(7).random()
+	assert fork.random() == RandomStream(7).fork("shuffle").random()
+	assert fork.random() != rng.fork("draws").random()
+
+
+def test_order_of_play():
+	game1 = prepare_game()
+	game2 = prepare_game()
+	wisp1 = game1.player1.summon(WISP)
+	wisp2 = game2.player1.summon(WISP)
+	assert wisp1.order_of_play == wisp2.order_of_play
+	wisp3 = game1.player1.summon(WISP)
+	assert wisp3.order_of_play == wisp1.order_of_play + 1
+	assert game2.player1.summon(WISP).order_of_play == wisp3.order_of_play
+
+
+def test_simulation():
+	from fireplace import sim
+
+	def results(processes):
+		ret = sim.simulate(6, seed=3, processes=processes, brawl="BananaBrawl", max_turns=20)
+		ret = sorted(ret, key=lambda result: result["game"])
+		for result in ret:
+			del result["time"]
+		return ret
+
+	expected = results(1)
+	assert [result["seed"] for result in expected] == ["3/%i" % (i) for i in range(6)]
+	assert all(result["turns"] <= 21 for result in expected)
+	assert results(1) == expected
+	assert results(2) == expected
+
+
+def test_simulation_stopped():
+	from fireplace import sim
+
+	def trade(game, player, rng):
+		# A minion dies every turn, but nobody loses
+		player.summon(WISP).destroy()
+
+	sim.AGENTS["trade"] = trade
+	try:
+		result = sim.play_game(1, agent1="trade", agent2="trade", max_turns=4)
+	finally:
+		del sim.AGENTS["trade"]
+	assert result["turns"] == 5
+	assert result["winner"] is None
+
+
+def test_logging_switch():
+	from fireplace.logging import set_enabled
+
+	class Handler(logging.Handler):
+		def emit(self, record):
+			records.append(record.getMessage())
+
+	records = []
+	handler = Handler()
+	logger = logging.getLogger("fireplace")
+	logger.addHandler(handler)
+	try:
+		game = prepare_game()
+		wisp = game.player1.summon(WISP)
+		assert "Summoning %r" % (wisp) in records
+		del records[:]
+		set_enabled(False)
+		try:
+			game.player1.summon(WISP)
+		finally:
+			set_enabled(True)
+		assert not records
+	finally:
+		logger.removeHandler(handler)
+
+
+def test_event_log():
+	import os
+	import tempfile
+	from fireplace import eventlog
+
+	fd, path = tempfile.mkstemp()
+	os.close(fd)
+	os.remove(path)
+	try:
+		game = prepare_game()
+		with eventlog.EventLogWriter(path) as writer:
+			game.manager.register(writer)
+			wisp = game.player1.summon(WISP)
+			game.player1.give(MOONFIRE).play(target=wisp)
+			game.end_turn()
+		events = list(eventlog.read_events(path))
+	finally:
+		os.remove(path)
+
+	assert events[0] == (eventlog.GAME, )
+	created = [e[2] for e in events if e[0] == eventlog.NEW_ENTITY]
+	assert created == [WISP, MOONFIRE]
+	actions = [e[2] for e in events if e[0] == eventlog.ACTION]
+	assert "Play" in actions
+	assert "Damage" in actions
+	damage = [e for e in events if e[0] == eventlog.ACTION and e[2] == "Damage"][0]
+	assert damage[3][1] == [wisp.manager.id]
+	assert [e[2] for e in events if e[0] == eventlog.ACTION_END].count("Damage") == 1
+
+	# Turn actions have no PowSubType
+	actions = [e[:3] for e in events if e[0] in (eventlog.ACTION, eventlog.ACTION_END)]
+	turns = [e for e in actions if e[2] in ("BeginTurn", "EndTurn")]
+	assert turns == [
+		(eventlog.ACTION, None, "EndTurn"),
+		(eventlog.ACTION, None, "BeginTurn"),
+		(eventlog.ACTION_END, None, "BeginTurn"),
+		(eventlog.ACTION_END, None, "EndTurn"),
+	]
+	end_turn = [e for e in events if e[0] == eventlog.ACTION and e[2] == "EndTurn"][0]
+	assert end_turn[3][1] == game.player1.manager.id
+	assert [e[1] for e in events if e[0] == eventlog.ACTION and e[2] == "Play"] == [PowSubType.PLAY]
+
+
+def test_tag_deltas():
+	from fireplace.managers import DeltaObserver
+
+	game = prepare_game()
+	batches = []
+	observer = DeltaObserver(batches.append)
+	game.manager.register(observer)
+	yeti = game.player2.summon("CS2_182")
+	del batches[:]
+	moonfire = game.player1.give(MOONFIRE)
+	moonfire.play(target=yeti)
+	observer.flush()
+	changes = [change for batch in batches for change in batch]
+	assert (yeti.manager.id, GameTag.DAMAGE, 1) in changes
+	# Played spells stay in PLAY
+	assert (moonfire.manager.id, GameTag.ZONE, Zone.PLAY) in changes
+	assert moonfire.zone == Zone.PLAY
+	assert (moonfire.manager.id, GameTag.CONTROLLER, game.player1.manager.id) in changes
+	for batch in batches:
+		assert len(set((id, tag) for id, tag, value in batch)) == len(batch)
+
+	# Writing the same value again is not a change
+	del batches[:]
+	yeti.damage = 1
+	observer.flush()
+	assert not batches
+
+	# Only the observed game reports its tag changes
+	assert game.manager.track_tags
+	assert not prepare_game().manager.track_tags
+	assert not game.clone().manager.track_tags
+	assert not Game.from_snapshot(game.snapshot()).manager.track_tags
+
+
+def test_replay():
+	from fireplace.replay import Recorder, ReplayError, replay, state_hash
+	from fireplace.sim import random_agent
+	from fireplace.utils import RandomStream
+
+	game = prepare_game(WARRIOR, HUNTER, seed=5)
+	recorder = Recorder(game)
+	rng = RandomStream(5)
+	for i in range(8):
+		random_agent(game, game.current_player, rng)
+		game.end_turn()
+	data = recorder.dumps()
+	assert len(data) < 1024
+
+	replayed = replay(data)
+	assert replayed.turn == game.turn == 9
+	assert state_hash(replayed) == state_hash(game)
+	assert [card.id for card in replayed.player1.hand] == [card.id for card in game.player1.hand]
+
+	# Missing a decision ends in another state
+	recorder.decisions.pop()
+	try:
+		replay(recorder.dumps())
+	except ReplayError:
+		pass
+	else:
+		assert False, "The replay should not match"
+
+
+def test_concurrent_games():
+	from concurrent.futures import ThreadPoolExecutor
+
+	def play_game(i):
+		game = prepare_game()
+		for i in range(3):
+			game.player1.give(WISP).play()
+		yeti1 = game.player2.summon("CS2_182")
+		yeti2 = game.player2.summon("CS2_182")
+		game.player1.give("CS2_093").play()
+		game.player1.give(MOONFIRE).play(target=yeti1)
+		game.end_turn()
+		return (
+			len(game.player1.field), yeti1.health, yeti2.health,
+			game.player2.hero.health, game.turn,
+		)
+
+	expected = play_game(0)
+	assert expected == (3, 2, 3, 28, 2)
+	with ThreadPoolExecutor(max_workers=8) as executor:
+		results = list(executor.map(play_game, range(64)))
+	assert results == [expected] * 64
+
+
+def _game_state(game):
+	# The tags of every entity, with entities replaced by their id
+	ret = []
+	for entity in game.all_entities:
+		tags = {}
+		for tag, value in entity.tags.items():
+			tags[tag] = getattr(getattr(value, "manager", None), "id", value)
+		ret.append((entity.manager.id, sorted(tags.items())))
+	return ret
+
+
+def test_snapshot():
+	game = prepare_game(seed=1)
+	game.player1.give("EX1_100").play()
+	game.player1.give("CS2_122").play()
+	game.player1.summon(WISP)
+	yeti = game.player2.summon("CS2_182")
+	game.player1.give("CS2_092").play(target=yeti)
+	data = game.snapshot()
+	assert isinstance(data, bytes)
+
+	copy = Game.from_snapshot(data)
+	assert type(copy) is type(game)
+	assert _game_state(copy) == _game_state(game)
+	assert copy.random.getstate() == game.random.getstate()
+	assert copy.manager.counter == game.manager.counter
+	assert copy.manager.order_of_play == game.manager.order_of_play
+	field = copy.player1.field
+	assert [card.id for card in field] == ["EX1_100", "CS2_122", WISP]
+	assert field.index(field[2]) == 2
+	assert field[2].controller is copy.player1
+	assert field[2].data is game.player1.field[2].data
+	assert field[2].atk == 2
+	yeti2 = copy.player2.field[0]
+	assert yeti2.atk == 8
+	assert yeti2.health == 9
+	assert yeti2.buffs[0].id == "CS2_092e"
+	assert yeti2.buffs[0].owner is yeti2
+
+	# The card script listeners (Lorewalker Cho) are restored too
+	hand = len(game.player2.hand)
+	copy.player1.give(THE_COIN).play()
+	assert copy.player2.hand[-1].id == THE_COIN
+	assert len(game.player2.hand) == hand
+
+
+def test_snapshot_playthrough():
+	def play(game):
+		game.player1.summon("EX1_100")
+		game.player1.give("EX1_277").play()
+		game.end_turn()
+		game.player2.give(MOONFIRE).play(target=game.player1.field[0])
+		game.end_turn()
+		return _game_state(game)
+
+	game = prepare_game(seed=3)
+	for i in range(3):
+		game.player2.summon(WISP)
+	data = game.snapshot()
+	expected = play(game)
+	assert play(Game.from_snapshot(data)) == expected
+	assert play(Game.from_snapshot(data)) == expected
+
+	try:
+		Game.from_snapshot(b"not a snapshot")
+	except ValueError:
+		pass
+	else:
+		assert False, "Invalid snapshots should be rejected"
+
+
 def main():
 	for name, f in globals().items():
 		if name.startswith("test_") and callable(f):
@@ -2,7 +2,7 @@
 import sys; sys.path.append("..")
 from fireplace.enums import Race, CardType, Zone
 from fireplace.targeting import Affiliation, Selector
-from test_main import prepare_game
+from test_main import prepare_game, MOONFIRE
 
 
 def test_selector():
@@ -29,6 +29,93 @@ def test_empty_selector():
 	assert not targets
 
 
+def test_compiled_selector():
+	from fireplace.targeting import FRIENDLY_MINIONS, RANDOM_ENEMY_MINION, SELF
+	game = prepare_game()
+	wisp1 = game.player1.give("CS2_231")
+	wisp1.play()
+	wisp2 = game.player1.give("CS2_231")
+	wisp2.play()
+	game.player2.summon("CS2_231")
+
+	stages = FRIENDLY_MINIONS.compile()
+	assert FRIENDLY_MINIONS.eval(game, game.player1) == [wisp1, wisp2]
+	assert FRIENDLY_MINIONS.compile() is stages
+	assert (FRIENDLY_MINIONS - SELF).eval(game, wisp1) == [wisp2]
+	assert FRIENDLY_MINIONS.test(wisp1, game.player1)
+	assert not FRIENDLY_MINIONS.test(wisp1, game.player2)
+
+	targets = RANDOM_ENEMY_MINION.eval(game, game.player1)
+	assert targets == game.player2.field
+
+	selector = Selector(Zone.HAND)
+	selector.compile()
+	selector.program = Selector(Zone.PLAY).program
+	assert wisp1 in selector.eval(game, game.player1)
+
+
+def test_custom_selector_op():
+	def _xor(self, stack):
+		a = stack.pop()
+		b = stack.pop()
+		stack.append(a != b)
+
+	game = prepare_game()
+	wisp = game.player1.give("CS2_231")
+	wisp.play()
+	enemy_wisp = game.player2.summon("CS2_231")
+
+	selector = Selector(CardType.MINION)
+	selector.program += [Affiliation.FRIENDLY, _xor]
+	targets = selector.eval(game, game.player1)
+	assert not any(e is wisp for e in targets)
+	assert any(e is enemy_wisp for e in targets)
+	assert any(e is game.player1 for e in targets)
+	assert selector.test(enemy_wisp, game.player1)
+	assert not selector.test(wisp, game.player1)
+
+
+def test_planned_selectors():
+	from fireplace import targeting
+	game = prepare_game()
+	for i in range(3):
+		game.player1.give("CS2_231").play()
+		game.player2.summon("CS2_231")
+	game.player1.give("EX1_561")
+	game.end_turn()
+	moonfire = game.player2.give(MOONFIRE)
+	moonfire.target = game.player1.field[0]
+
+	# The planner has to actually narrow down the candidates
+	plan = targeting.FRIENDLY_MINIONS.compile()[0][2]
+	candidates = targeting._plan_candidates(game, game.player1, plan)
+	assert candidates is not None
+	assert len(candidates) < len(list(game))
+
+	selectors = [
+		getattr(targeting, name) for name in dir(targeting)
+		if name.isupper() and isinstance(getattr(targeting, name), Selector)
+	]
+	for selector in selectors:
+		if isinstance(selector, targeting.RandomSelector):
+			continue
+		sources = [game.player1, game.player2, game.player1.field[0], moonfire]
+		if any(
+			op is Affiliation.TARGET or isinstance(op, targeting.TargetSelector.IsTarget)
+			for op in selector.program
+		):
+			# Those need a source with a target
+			sources = [moonfire]
+		elif selector is targeting.SELF_ADJACENT:
+			sources = [game.player1.field[1]]
+		elif isinstance(selector, targeting.OwnerSelector):
+			# Those need a source with an owner (eg. an enchantment)
+			continue
+		for source in sources:
+			planned = selector.eval(game, source)
+			assert [id(e) for e in planned] == [id(e) for e in selector.eval(list(game), source)]
+
+
 def main():
 	for name, f in globals().items():
 		if name.startswith("test_") and callable(f):